@@ -1,29 +1,27 @@
+import numpy as np
 import pandas as pd
 import warnings
 from pathlib import Path
+from scipy import sparse
 
 warnings.filterwarnings('ignore')
 
 
 class Attestation:
-    def __init__(self, attest_path, target_path):
+    def __init__(self, attest_path, target_path, student_ids=None):
         self.attest_path = Path(attest_path)
         self.target_path = Path(target_path)
+        # optional subset of students, applied to every file as soon as it is read
+        self.student_ids = student_ids
         #  get a list of files in the directory
         self.attest_list = list(self.attest_path.glob("*.xlsx"))
 
-        # read all the files into a single dataframe
-        self.df_list = [pd.read_excel(file) for file in self.attest_list]
-        self.attest_data = pd.concat(self.df_list, ignore_index=True)
         self.target_data = pd.read_csv(target_path)
         self.passed = ['зачтено', 'академическая разница', 'отлично', 'хорошо', 'удовлетворительно']
         self.not_passed = ['Неявка', 'Не зачтено', 'неудовлетворительно']
-        self.attest_data.drop(['Unnamed: 1', 'Unnamed: 16',
-                               'Unnamed: 2', 'Unnamed: 14', 'Unnamed: 15',
-                               'Unnamed: 4', 'Unnamed: 12', 'Unnamed: 13',
-                               'Unnamed: 0', 'Unnamed: 10', 'Unnamed: 11',
-                               'Unnamed: 3', 'Unnamed: 8', 'Unnamed: 9',
-                               'Unnamed: 5', 'Unnamed: 6', 'Unnamed: 7'], axis=1, inplace=True)
+        self.outcomes = ['passed', 'failed', 'absent']
+        # natural key of an attestation record, used to drop duplicates across workbooks
+        self.record_key = ['record_book', 'study_plan', 'discipline', 'test_type', 'period', 'grade']
         # rename fields
         self.new_col_names = {
             "НСИ ИД": 'student_id',
@@ -41,8 +39,43 @@ class Attestation:
             "Есть выборы": "has_choice",
             "Выбрана": "chosen"
         }
-        self.attest_data.rename(columns=self.new_col_names, inplace=True)
-        self.attest_data['period'] = pd.to_datetime(self.attest_data['period'], dayfirst=True, errors='coerce')
+        self.load_attest_data()
+
+    def load_attest_data(self):
+        # read all the files into a single dataframe, dropping records already seen
+        self.df_list, self.duplicate_counts = [], {}
+        seen_hashes = np.array([], dtype=np.uint64)
+        for file in self.attest_list:
+            attest_file = self.clean_attest_data(self.read_attest_file(file))
+            unique, hashes = self.drop_duplicate_records(attest_file, seen_hashes)
+            self.duplicate_counts[file.name] = len(attest_file) - len(unique)
+            seen_hashes = np.concatenate([seen_hashes, hashes])
+            self.df_list.append(unique)
+        self.attest_data = pd.concat(self.df_list, ignore_index=True)
+
+    def drop_duplicate_records(self, attest_data, seen_hashes):
+        # records are the same if they share the natural key; compared through 64-bit hashes
+        # of the key, within the file and against the files read before
+        hashes = pd.util.hash_pandas_object(attest_data[self.record_key], index=False).to_numpy()
+        duplicated = pd.Series(hashes).duplicated().to_numpy() | np.isin(hashes, seen_hashes)
+        return attest_data[~duplicated], hashes[~duplicated]
+
+    def clean_attest_data(self, attest_data):
+        attest_data = attest_data.drop(['Unnamed: 1', 'Unnamed: 16',
+                                        'Unnamed: 2', 'Unnamed: 14', 'Unnamed: 15',
+                                        'Unnamed: 4', 'Unnamed: 12', 'Unnamed: 13',
+                                        'Unnamed: 0', 'Unnamed: 10', 'Unnamed: 11',
+                                        'Unnamed: 3', 'Unnamed: 8', 'Unnamed: 9',
+                                        'Unnamed: 5', 'Unnamed: 6', 'Unnamed: 7'], axis=1)
+        attest_data.rename(columns=self.new_col_names, inplace=True)
+        attest_data['period'] = pd.to_datetime(attest_data['period'], dayfirst=True, errors='coerce')
+        return attest_data
+
+    def read_attest_file(self, file):
+        attest_file = pd.read_excel(file)
+        if self.student_ids is not None:
+            attest_file = attest_file[attest_file["НСИ ИД"].isin(self.student_ids)]
+        return attest_file
 
     def preprocess(self):
         self.target_data['start_date'] = pd.to_datetime(self.target_data['start_date'])
@@ -87,8 +120,6 @@ class Attestation:
         # Filter the records for the desired period of interest
         filtered_data = joined_data[(joined_data['period'] > joined_data['global_start_date']) & (
                 joined_data['period'] < joined_data['end_date'])]
-        # drop duplicates
-        filtered_data.drop_duplicates(inplace=True)
 
         return filtered_data
 
@@ -96,12 +127,221 @@ class Attestation:
         self.target_path = target_path
         self.target_data = pd.read_csv(self.target_path)
         self.preprocess()
+        if self.student_ids is not None:
+            self.target_data = self.target_data[self.target_data['student_id'].isin(self.student_ids)]
+        aggregates = self.aggregate()
+        if aggregates is None:
+            return pd.DataFrame()
+        return self.build_features(aggregates)
+
+    def extract_features_incremental(self, target_paths):
+        # windows of a student that share global_start_date are nested, so each record is
+        # aggregated once into the slice before the first end_date after it, and the
+        # slices are summed forward; gives the same features as extract_features per target
+        targets = []
+        for target_path in target_paths:
+            self.target_data = pd.read_csv(target_path)
+            self.preprocess()
+            if self.student_ids is not None:
+                self.target_data = self.target_data[self.target_data['student_id'].isin(self.student_ids)]
+            targets.append(self.target_data)
+
+        attest_ids = set(self.attest_data['student_id'].unique())
+        windows = pd.concat([target[['student_id', 'global_start_date', 'end_date']] for target in targets])
+        windows = windows[windows['student_id'].isin(attest_ids)].dropna().drop_duplicates()
+        windows = windows.sort_values(['student_id', 'global_start_date', 'end_date'], ignore_index=True)
+        windows['window'] = windows.index
+
+        records = self.attest_data.merge(windows[['student_id', 'global_start_date']].drop_duplicates(), on='student_id')
+        records = records[records['period'] > records['global_start_date']]
+        records = pd.merge_asof(records.sort_values('period'), windows.sort_values('end_date'),
+                                left_on='period', right_on='end_date', by=['student_id', 'global_start_date'],
+                                direction='forward', allow_exact_matches=False)
+        records = records.dropna(subset=['window'])
+        if records.empty:
+            return [pd.DataFrame() for _ in targets]
+        records['window'] = records['window'].astype(int)
+        # kept for discipline_matrix(features, target_index)
+        self.records, self.windows, self.target_windows = records, windows, []
+        self.window_discipline_matrix = None
+
+        exam_filter = records[records['test_type'] == "Экзамен"]
+        exam_filter['points'] = exam_filter['grade'].apply(self.points_from_grade)
+        zachot_filter = records[(records['test_type'] == "Зачет") & (records['grade'] != "Не выбрал")]
+        zachot_filter['zachot_points'] = pd.to_numeric(zachot_filter['grade'].apply(self.zachot_points),
+                                                       errors='coerce')
+
+        def carry_forward(slices):
+            # running totals over the nested windows of each student and start date
+            slices = slices.reindex(windows['window'], fill_value=0)
+            return slices.groupby([windows['student_id'].values, windows['global_start_date'].values]).cumsum()
+
+        running = {
+            'records': carry_forward(records.groupby('window').size().to_frame('size')),
+            'test_type_count': carry_forward(records.groupby(['window', 'test_type']).size().unstack(fill_value=0)),
+            'grade_count': carry_forward(records.groupby(['window', 'grade']).size().unstack(fill_value=0)),
+            'points': carry_forward(exam_filter.groupby('window')['points'].agg(['sum', 'count'])),
+            'zachot_points': carry_forward(zachot_filter.groupby('window')['zachot_points'].agg(['sum', 'count', 'size'])),
+            'optional': carry_forward(zachot_filter.groupby(['window', 'has_choice']).size().unstack(fill_value=0)),
+            'chosen_subject': carry_forward(zachot_filter.groupby(['window', 'chosen']).size().unstack(fill_value=0))
+        }
+
+        features = []
+        for target in targets:
+            self.target_data = target
+            self.inner_ids = set(target['student_id'].unique()) & attest_ids
+            target_windows = target[['id', 'student_id', 'global_start_date', 'end_date']].merge(
+                windows, on=['student_id', 'global_start_date', 'end_date'])
+            self.target_windows.append(target_windows)
+            aggregates = self.window_aggregates(running, target_windows)
+            features.append(pd.DataFrame() if aggregates is None else self.build_features(aggregates))
+
+        return features
+
+    def window_aggregates(self, running, target_windows):
+        # turn the running totals of each target row's window into the aggregates of aggregate()
+        def for_ids(totals):
+            return totals.loc[target_windows['window']].set_axis(pd.Index(target_windows['id'], name='id'))
+
+        def counts(totals, column):
+            stacked = for_ids(totals).rename_axis(columns=column).stack()
+            return stacked[stacked > 0].reset_index(name='count')
+
+        if for_ids(running['records'])['size'].sum() == 0:
+            return None
+
+        points = for_ids(running['points'])
+        points = points[points['count'] > 0]
+        zachot_points = for_ids(running['zachot_points'])
+        zachot_points = zachot_points[zachot_points['size'] > 0]
+
+        return {
+            'test_type_count': counts(running['test_type_count'], 'test_type'),
+            'grade_count': counts(running['grade_count'], 'grade'),
+            'student_gpa': (points['sum'] / points['count']).sort_index().to_frame('points'),
+            'zachot_gpa': (zachot_points['sum'] / zachot_points['count']).sort_index().to_frame('zachot_points'),
+            'optional': counts(running['optional'], 'has_choice'),
+            'chosen_subject': counts(running['chosen_subject'], 'chosen')
+        }
+
+    def discipline_records(self):
+        # (id, discipline, grade) of the records in the current target's windows
+        return self.filtered_data[['id', 'discipline', 'grade']]
+
+    def discipline_grade_counts(self):
+        # (discipline, grade, count) over all attestation records
+        return self.attest_data.groupby(['discipline', 'grade']).size().reset_index(name='count')
+
+    def outcome_codes(self, grades):
+        # 0 passed, 1 failed, 2 absent, -1 for grades without an outcome (not chosen, missing)
+        codes = np.full(len(grades), -1)
+        codes[grades.isin(self.passed).to_numpy()] = 0
+        codes[grades.isin(self.not_passed).to_numpy()] = 1
+        codes[(grades == "Неявка").to_numpy()] = 2
+        return codes
+
+    def set_discipline_space(self, projection=None, n_features=1024):
+        # fixed discipline x outcome column space shared by every target; `projection`
+        # keeps only the n_features most frequent columns ('top_k') or hashes them ('hash')
+        counts = self.discipline_grade_counts()
+        counts['outcome'] = self.outcome_codes(counts['grade'])
+        counts = counts[counts['outcome'] >= 0].groupby(['discipline', 'outcome'])['count'].sum()
+
+        self.disciplines = pd.Index(sorted(counts.index.get_level_values('discipline').unique()))
+        names = np.array([f"{discipline}__{outcome}" for discipline in self.disciplines
+                          for outcome in self.outcomes])
+        full_codes = (self.disciplines.get_indexer(counts.index.get_level_values('discipline')) * len(self.outcomes)
+                      + counts.index.get_level_values('outcome'))
+
+        self.column_map = np.full(len(names), -1)
+        if projection == 'hash':
+            self.column_map = (pd.util.hash_array(names) % n_features).astype(int)
+            self.discipline_columns = [f"discipline_hash_{i}" for i in range(n_features)]
+        else:
+            if projection == 'top_k':
+                full_codes = full_codes[np.argsort(-counts.to_numpy(), kind='stable')[:n_features]]
+            full_codes = np.sort(full_codes)
+            self.column_map[full_codes] = np.arange(len(full_codes))
+            self.discipline_columns = list(names[full_codes])
+
+    def encode_disciplines(self, records):
+        # column of each record in the discipline space, -1 if it has none
+        disciplines = self.disciplines.get_indexer(records['discipline'])
+        outcomes = self.outcome_codes(records['grade'])
+        columns = self.column_map[np.maximum(disciplines, 0) * len(self.outcomes) + np.maximum(outcomes, 0)]
+        columns[(disciplines < 0) | (outcomes < 0)] = -1
+        return columns
+
+    def count_matrix(self, rows, columns, n_rows):
+        keep = columns >= 0
+        return sparse.csr_matrix((np.ones(keep.sum(), dtype=np.float32), (rows[keep], columns[keep])),
+                                 shape=(n_rows, len(self.discipline_columns)))
+
+    def discipline_matrix(self, features, target_index=None):
+        # sparse counts of passed/failed/absent per discipline, rows in the order of `features`;
+        # `target_index` selects a target of the last extract_features_incremental call
+        if target_index is None:
+            records = self.discipline_records()
+            rows = pd.Index(features['id']).get_indexer(records['id'])
+            return self.count_matrix(rows, np.where(rows >= 0, self.encode_disciplines(records), -1),
+                                     len(features))
+
+        if self.window_discipline_matrix is None:
+            # counts of the slice before each window, summed over the earlier windows of the
+            # same student and start date with a block lower-triangular operator
+            windows = self.windows
+            slices = self.count_matrix(self.records['window'].to_numpy(), self.encode_disciplines(self.records),
+                                       len(windows))
+            group = windows.groupby(['student_id', 'global_start_date']).cumcount().to_numpy()
+            rows = np.repeat(windows['window'].to_numpy(), group + 1)
+            first = np.repeat(windows['window'].to_numpy() - group, group + 1)
+            cols = first + np.arange(len(rows)) - np.repeat(np.cumsum(group + 1) - (group + 1), group + 1)
+            prefix = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                                       shape=(len(windows), len(windows)))
+            self.window_discipline_matrix = (prefix @ slices).tocsr()
+
+        window_of_id = self.target_windows[target_index].set_index('id')['window']
+        return self.window_discipline_matrix[window_of_id.loc[features['id']].to_numpy()]
+
+    def aggregate(self):
+        # per-id aggregates of the records in each target window, before pivoting
         filtered_data = self.filter_data()
         if filtered_data.shape[0] == 0:
-            return pd.DataFrame()
-        # get test type features
+            return None
+        self.filtered_data = filtered_data
         test_type_count = filtered_data.groupby(['id', 'test_type']).size().reset_index(name='count')
-        test_type_count = test_type_count.pivot_table(index='id', columns='test_type', values='count', fill_value=0)
+        grade_count = filtered_data.groupby(['id', 'grade']).size().reset_index(name='count')
+
+        # filter based on exam to calculate the gpa
+        exam_filter = filtered_data[filtered_data['test_type'] == "Экзамен"]
+        exam_filter['points'] = exam_filter['grade'].apply(self.points_from_grade)
+        student_gpa = exam_filter.groupby(['id'])[['points']].mean()
+
+        # filter for zachot and extract features there
+        zachot_filter = filtered_data[(filtered_data['test_type'] == "Зачет") & (filtered_data['grade'] != "Не выбрал")]
+        # create a column to store the points from zachots
+        zachot_filter['zachot_points'] = zachot_filter['grade'].apply(self.zachot_points)
+        zachot_filter['zachot_points'] = pd.to_numeric(zachot_filter['zachot_points'], errors='coerce')
+        zachot_gpa = zachot_filter.groupby(['id'])[['zachot_points']].mean()
+
+        # for subjects that are optional or not
+        optional = zachot_filter.groupby(['id', 'has_choice']).size().reset_index(name='count')
+        # for subjects that were chosen
+        chosen_subject = zachot_filter.groupby(['id', 'chosen']).size().reset_index(name='count')
+
+        return {
+            'test_type_count': test_type_count,
+            'grade_count': grade_count,
+            'student_gpa': student_gpa,
+            'zachot_gpa': zachot_gpa,
+            'optional': optional,
+            'chosen_subject': chosen_subject
+        }
+
+    def build_features(self, aggregates):
+        # get test type features
+        test_type_count = aggregates['test_type_count'].pivot_table(index='id', columns='test_type', values='count',
+                                                                     fill_value=0)
 
         # rename columns for easy reference
         test_type_cols = {
@@ -119,8 +359,7 @@ class Attestation:
         test_type_count.rename(columns=test_type_cols, inplace=True)
 
         # let's extract some features from grades
-        grade_count = filtered_data.groupby(['id', 'grade']).size().reset_index(name='count')
-        grade_count = grade_count.pivot_table(index='id', columns='grade', values='count', fill_value=0)
+        grade_count = aggregates['grade_count'].pivot_table(index='id', columns='grade', values='count', fill_value=0)
 
         # again rename the columns
         grade_cols = {
@@ -139,32 +378,19 @@ class Attestation:
             if col not in grade_cols.values():
                 del grade_count[col]
 
-        # filter based on exam to calculate the gpa
-        exam_filter = filtered_data[filtered_data['test_type'] == "Экзамен"]
-        exam_filter['points'] = exam_filter['grade'].apply(self.points_from_grade)
-
-        student_gpa = exam_filter.groupby(['id'])[['points']].mean()
-        student_gpa.rename(columns={"points": "GPA"}, inplace=True)
-
-        # filter for zachot and extract features there
-        zachot_filter = filtered_data[(filtered_data['test_type'] == "Зачет") & (filtered_data['grade'] != "Не выбрал")]
-        # create a column to store the points from zachots
-        zachot_filter['zachot_points'] = zachot_filter['grade'].apply(self.zachot_points)
-        zachot_filter['zachot_points'] = pd.to_numeric(zachot_filter['zachot_points'], errors='coerce')
-        zachot_gpa = zachot_filter.groupby(['id'])[['zachot_points']].mean()
-        zachot_gpa.rename(columns={"zachot_points": "zachot_gpa"}, inplace=True)
+        student_gpa = aggregates['student_gpa'].rename(columns={"points": "GPA"})
+        zachot_gpa = aggregates['zachot_gpa'].rename(columns={"zachot_points": "zachot_gpa"})
 
         # for subjects that are optional or not
-        optional = zachot_filter.groupby(['id', 'has_choice']).size().reset_index(name='count')
-        optional = optional.pivot_table(index='id', columns='has_choice', fill_value=0, values='count')
+        optional = aggregates['optional'].pivot_table(index='id', columns='has_choice', fill_value=0, values='count')
         optional.rename(columns={
             "Да": "optional_subject_zachot",
             "Нет": "not_optional_subject"
         }, inplace=True)
 
         # for subjects that were chosen
-        chosen_subject = zachot_filter.groupby(['id', 'chosen']).size().reset_index(name='count')
-        chosen_subject = chosen_subject.pivot_table(index='id', columns='chosen', fill_value=0, values='count')
+        chosen_subject = aggregates['chosen_subject'].pivot_table(index='id', columns='chosen', fill_value=0,
+                                                                  values='count')
         chosen_subject.rename(columns={
             "Да": "chosen_subject_zachot",
             "Нет": "not_chosen_subject_zachot"
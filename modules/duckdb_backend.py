@@ -0,0 +1,234 @@
+import duckdb
+import numpy as np
+import pandas as pd
+import warnings
+
+from modules.attestation import Attestation
+from modules.movement import StudentAnalysis
+from modules.static import Static
+
+warnings.filterwarnings('ignore')
+
+
+# Out-of-core versions of the feature extractors. Raw records are loaded into an
+# embedded DuckDB database and the window join, filtering and aggregation run there,
+# spilling to `temp_directory` above `memory_limit` and using all cores unless
+# `threads` is set. Only the small per-id aggregates come back to pandas, where the
+# pandas classes' own `build_features` pivots and merges them, so both backends
+# produce the same features.
+
+
+def connect(settings=None):
+    settings = settings or {}
+    config = {'preserve_insertion_order': False}
+    for key in ['memory_limit', 'temp_directory', 'threads']:
+        if settings.get(key) is not None:
+            config[key] = settings[key]
+    return duckdb.connect(config=config)
+
+
+def insert_frame(con, table, frame, create):
+    # copy a pandas frame into a DuckDB table, creating it on the first call
+    con.register('frame_view', frame)
+    if create:
+        con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM frame_view")
+    else:
+        con.execute(f"INSERT INTO {table} BY NAME SELECT * FROM frame_view")
+    con.unregister('frame_view')
+
+
+def register_targets(con, target_data):
+    con.register('targets', target_data[['id', 'student_id', 'global_start_date', 'end_date']])
+
+
+class DuckDBAttestation(Attestation):
+    def __init__(self, attest_path, target_path, student_ids=None, settings=None):
+        self.con = connect(settings)
+        super().__init__(attest_path, target_path, student_ids)
+
+    def load_attest_data(self):
+        # one workbook at a time, so pandas never holds more than a single file and the key hashes
+        self.duplicate_counts = {}
+        seen_hashes = np.array([], dtype=np.uint64)
+        for i, file in enumerate(self.attest_list):
+            attest_file = self.clean_attest_data(self.read_attest_file(file))
+            unique, hashes = self.drop_duplicate_records(attest_file, seen_hashes)
+            self.duplicate_counts[file.name] = len(attest_file) - len(unique)
+            seen_hashes = np.concatenate([seen_hashes, hashes])
+            insert_frame(self.con, 'attest', unique, create=i == 0)
+        self.attest_ids = set(self.con.execute("SELECT DISTINCT student_id FROM attest").df()['student_id'])
+
+    def aggregate(self):
+        self.inner_ids = set(self.target_data['student_id'].unique()) & self.attest_ids
+        register_targets(self.con, self.target_data)
+        # same rows as filter_data
+        self.con.execute("""
+            CREATE OR REPLACE TEMP TABLE filtered AS
+            SELECT t.id, t.student_id, t.global_start_date, t.end_date, a.* EXCLUDE (student_id)
+            FROM targets t JOIN attest a ON t.student_id = a.student_id
+            WHERE a.period > t.global_start_date AND a.period < t.end_date
+        """)
+        if self.con.execute("SELECT COUNT(*) FROM filtered").fetchone()[0] == 0:
+            return None
+
+        def counts(column, where="TRUE"):
+            return self.con.execute(f"""
+                SELECT id, {column}, COUNT(*) AS count FROM filtered
+                WHERE {column} IS NOT NULL AND {where}
+                GROUP BY ALL ORDER BY id, {column}
+            """).df()
+
+        zachot = "test_type = 'Зачет' AND grade IS DISTINCT FROM 'Не выбрал'"
+        student_gpa = self.con.execute("""
+            SELECT id, AVG(CASE grade WHEN 'отлично' THEN 5 WHEN 'хорошо' THEN 4
+                                      WHEN 'удовлетворительно' THEN 3 WHEN 'неудовлетворительно' THEN 2
+                                      ELSE 0 END) AS points
+            FROM filtered WHERE test_type = 'Экзамен' GROUP BY id ORDER BY id
+        """).df().set_index('id')
+        zachot_gpa = self.con.execute(f"""
+            SELECT id, AVG(CASE WHEN list_contains($passed, grade) THEN 1
+                                WHEN list_contains($not_passed, grade) THEN 0
+                                ELSE TRY_CAST(grade AS DOUBLE) END) AS zachot_points
+            FROM filtered WHERE {zachot} GROUP BY id ORDER BY id
+        """, {'passed': self.passed, 'not_passed': self.not_passed}).df().set_index('id')
+
+        return {
+            'test_type_count': counts('test_type'),
+            'grade_count': counts('grade'),
+            'student_gpa': student_gpa,
+            'zachot_gpa': zachot_gpa,
+            'optional': counts('has_choice', zachot),
+            'chosen_subject': counts('chosen', zachot)
+        }
+
+    def discipline_records(self):
+        return self.con.execute("SELECT id, discipline, grade FROM filtered").df()
+
+    def discipline_grade_counts(self):
+        return self.con.execute("""
+            SELECT discipline, grade, COUNT(*) AS count FROM attest
+            WHERE discipline IS NOT NULL AND grade IS NOT NULL GROUP BY ALL
+        """).df()
+
+
+class DuckDBStudentAnalysis(StudentAnalysis):
+    def __init__(self, movement_path, anonymous_path, target_path, student_ids=None, chunksize=1_000_000,
+                 guid_table_dir=None, settings=None):
+        self.con = connect(settings)
+        super().__init__(movement_path, anonymous_path, target_path, student_ids, chunksize, guid_table_dir)
+
+    def load_movements(self, movement_path, chunksize):
+        # stream the export into DuckDB chunk by chunk, keeping the file order for ties
+        row_offset = 0
+        chunks = pd.read_csv(movement_path, encoding='windows-1251', sep=';', chunksize=chunksize)
+        for i, chunk in enumerate(chunks):
+            chunk = self.resolve_students(chunk).rename(columns=self.rename_cols)
+            chunk['date'] = pd.to_datetime(chunk['date'])
+            chunk['row_nr'] = range(row_offset, row_offset + len(chunk))
+            row_offset += len(chunk)
+            insert_frame(self.con, 'movements', chunk, create=i == 0)
+        self.mov_ids = set(self.con.execute("SELECT DISTINCT student_id FROM movements").df()['student_id'])
+
+    def aggregate(self):
+        self.inner_ids = set(self.target_data['student_id'].unique()) & self.mov_ids
+        register_targets(self.con, self.target_data)
+        self.con.execute("""
+            CREATE OR REPLACE TEMP TABLE filtered AS
+            SELECT t.id, m.row_nr,
+                   CASE m.building WHEN 'Общежитие' THEN 'Hostel'
+                                   WHEN 'Главный корпус' THEN 'Main Building'
+                                   WHEN 'Научная Библиотека' THEN 'Library'
+                                   WHEN 'Центр Культуры' THEN 'Cultural Centre'
+                                   WHEN 'Спорт.Корпус' THEN 'Sport Complex'
+                                   ELSE 'Academic Building' END AS building_type,
+                   CAST(m.date AS DATE) + CAST(m.time AS TIME) AS datetime
+            FROM targets t JOIN movements m ON t.student_id = m.student_id
+            WHERE m.date > t.global_start_date AND m.date < t.end_date
+        """)
+        if self.con.execute("SELECT COUNT(*) FROM filtered").fetchone()[0] == 0:
+            return None
+
+        building_count = self.con.execute("""
+            SELECT id, building_type, COUNT(*) AS count FROM filtered GROUP BY ALL ORDER BY id, building_type
+        """).df()
+        # time until the next event of the same window; ties keep the file order like a stable sort
+        total_time = self.con.execute("""
+            SELECT id, building_type, ABS(SUM(time_spent)) AS total_time FROM (
+                SELECT id, building_type,
+                       COALESCE(epoch(LEAD(datetime) OVER (PARTITION BY id ORDER BY datetime, row_nr) - datetime),
+                                0) AS time_spent
+                FROM filtered)
+            GROUP BY ALL ORDER BY id, building_type
+        """).df()
+        # value_counts + nlargest keep the alphabetically first building among equal counts
+        most_visited = self.con.execute("""
+            SELECT id, building_type, COUNT(*) AS most_visited FROM filtered GROUP BY id, building_type
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY id ORDER BY COUNT(*) DESC, building_type) = 1
+            ORDER BY id
+        """).df()
+
+        return {'building_count': building_count, 'total_time': total_time, 'most_visited': most_visited}
+
+
+class DuckDBStatic(Static):
+    def __init__(self, static_path, target_path, student_ids=None, settings=None):
+        self.con = connect(settings)
+        super().__init__(static_path, target_path, student_ids)
+        self.static_data['row_nr'] = range(len(self.static_data))
+        insert_frame(self.con, 'static', self.static_data, create=True)
+        self.static_ids = set(self.static_data['student_id'].unique())
+        del self.static_data
+
+    def aggregate(self):
+        self.inner_id = set(self.target_data['student_id'].unique()) & self.static_ids
+        register_targets(self.con, self.target_data)
+        self.con.execute("""
+            CREATE OR REPLACE TEMP TABLE filtered AS
+            SELECT t.id, s.* EXCLUDE (subject_1, subject_2, subject_3, spec_name),
+                   COALESCE(CAST(s.subject_1 AS VARCHAR), '') || ' ' AS subject_1,
+                   COALESCE(CAST(s.subject_2 AS VARCHAR), '') || ' ' AS subject_2,
+                   COALESCE(CAST(s.subject_3 AS VARCHAR), '') || ' ' AS subject_3,
+                   COALESCE(CAST(s.spec_name AS VARCHAR), '') || ' ' AS spec_name,
+                   (COALESCE(s.grade_1, 0) + COALESCE(s.grade_2, 0) + COALESCE(s.grade_3, 0))::DOUBLE
+                   / NULLIF((s.grade_1 IS NOT NULL)::INT + (s.grade_2 IS NOT NULL)::INT
+                            + (s.grade_3 IS NOT NULL)::INT, 0) AS mean_grade
+            FROM targets t JOIN static s ON t.student_id = s.student_id
+            WHERE s.office_enrollment_date <= t.end_date
+        """)
+
+        # string sums follow the workbook order like a pandas groupby sum
+        per_id = self.con.execute("""
+            SELECT id,
+                   string_agg(subject_1 || subject_2 || subject_3, '' ORDER BY row_nr) AS subjects,
+                   string_agg(spec_name, '' ORDER BY row_nr) AS spec_name,
+                   COUNT(DISTINCT year_enrollment) AS num_unique_enrollment_year,
+                   COUNT(DISTINCT edu_level) AS num_unique_edu_level
+            FROM filtered GROUP BY id ORDER BY id
+        """).df().set_index('id')
+        self.subjects = per_id['subjects']
+        self.spec_names = per_id['spec_name']
+        self.num_unique_enrollment_year = per_id[['num_unique_enrollment_year']]
+        self.num_unique_edu_level = per_id[['num_unique_edu_level']]
+
+        self.num_enrolled = self.con.execute("""
+            SELECT id, enrolled, COUNT(*) AS count FROM filtered WHERE enrolled IS NOT NULL
+            GROUP BY ALL ORDER BY id, enrolled
+        """).df()
+
+        # whole days between consecutive enrollment orders, 0 for the first one
+        time_spent = self.con.execute("""
+            SELECT id, AVG(days) AS avg_time_spent_days, SUM(days) AS total_time_spent_days FROM (
+                SELECT id, COALESCE(floor(date_diff('microsecond',
+                                                    LAG(office_enrollment_date) OVER w, office_enrollment_date)
+                                          / 86400000000), 0)::DOUBLE AS days
+                FROM filtered WINDOW w AS (PARTITION BY id ORDER BY office_enrollment_date))
+            GROUP BY id ORDER BY id
+        """).df().set_index('id')
+        self.avg_time_spent_per_student = time_spent[['avg_time_spent_days']]
+        self.total_time_spent_per_student = time_spent[['total_time_spent_days']]
+
+        # latest enrollment year per id, first in workbook order among ties
+        self.demographic_data = self.con.execute("""
+            SELECT id, age_at_enrollment, year_enrollment, country, enrolled, mean_grade FROM filtered
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY id ORDER BY year_enrollment DESC NULLS LAST, row_nr) = 1
+        """).df()
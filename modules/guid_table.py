@@ -0,0 +1,66 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+def normalize_guids(guids):
+    # movement GUIDs and the anonymous mapping differ in case, so both are compared lowercased
+    return guids.astype(str).str.lower()
+
+
+class GuidTable:
+    # Resolution table from normalized movement GUIDs to integer codes, built once per
+    # snapshot of the anonymous mapping workbook. A code is the position of a distinct
+    # GUID, and a GUID can map to several student records (НСИ_ИД), like the inner merge
+    # it replaces: `student_ids[offsets[code]:offsets[code + 1]]` are the students of a
+    # code, in workbook order. With a cache directory the table is saved as parquet under
+    # the hash of the workbook, so later runs and targets skip reading and normalizing it.
+
+    def __init__(self, anonymous_path, cache_dir=None):
+        self.anonymous_path = Path(anonymous_path)
+        self.snapshot = hashlib.sha256(self.anonymous_path.read_bytes()).hexdigest()[:16]
+        self.cache_path = Path(cache_dir) / f"guid_map_{self.snapshot}.parquet" if cache_dir else None
+
+        if self.cache_path is not None and self.cache_path.exists():
+            table = pd.read_parquet(self.cache_path)
+        else:
+            table = self.build_table()
+            if self.cache_path is not None:
+                self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+                table.to_parquet(self.cache_path, index=False)
+
+        # the table is grouped by GUID, so the students of a code are a contiguous slice
+        guid_codes, guids = pd.factorize(table['GUID'])
+        self.guids = pd.Index(guids)
+        self.offsets = np.r_[0, np.cumsum(np.bincount(guid_codes, minlength=len(guids)))]
+        self.student_ids = table['student_id'].to_numpy()
+        # GUIDs whose events are copied to more than one student record
+        self.multi_student_guids = self.guids[np.diff(self.offsets) > 1]
+
+    def build_table(self):
+        anonymous_data = pd.read_excel(self.anonymous_path)
+        table = pd.DataFrame({'GUID': normalize_guids(anonymous_data['ФизическоеЛицо']),
+                              'student_id': anonymous_data['НСИ_ИД']})
+        guid_codes, _ = pd.factorize(table['GUID'])
+        return table.iloc[np.argsort(guid_codes, kind='stable')].reset_index(drop=True)
+
+    def resolve(self, guids):
+        # code of each raw GUID (-1 if it is not in the table) and the distinct unmatched
+        # GUIDs; every distinct GUID is normalized and looked up once, and rows take the
+        # result through their factorized code
+        row_codes, uniques = pd.factorize(guids, use_na_sentinel=False)
+        normalized = normalize_guids(pd.Series(uniques))
+        unique_codes = self.guids.get_indexer(normalized)
+        return unique_codes[row_codes], set(normalized[unique_codes < 0])
+
+    def expand(self, codes):
+        # one (row, mapping entry) pair per student of each row's code; rows with code -1
+        # get none. Returns the row positions and the positions in `student_ids`
+        matched = np.flatnonzero(codes >= 0)
+        starts = self.offsets[codes[matched]]
+        counts = self.offsets[codes[matched] + 1] - starts
+        rows = np.repeat(matched, counts)
+        # position inside each row's slice: 0, 1, ... counts - 1
+        within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, np.repeat(starts, counts) + within
@@ -1,19 +1,21 @@
 import pandas as pd
 import warnings
 
+from modules.guid_table import GuidTable
+
 warnings.filterwarnings('ignore')
 
 
 class StudentAnalysis:
-    def __init__(self, movement_path, anonymous_path, target_path):
-        self.movements_data = pd.read_csv(movement_path, encoding='windows-1251', sep=';')
+    def __init__(self, movement_path, anonymous_path, target_path, student_ids=None, chunksize=1_000_000,
+                 guid_table_dir=None):
+        # optional subset of students used for sampled runs
+        self.student_ids = student_ids
         self.target_data = pd.read_csv(target_path)
         # self.target_data = pd.read_csv(target_path)
-        self.anonymous_data = pd.read_excel(anonymous_path)
-        self.anonymous_data.rename(columns={"ФизическоеЛицо": "GUID"}, inplace=True)
-        self.anonymous_data['GUID'] = self.anonymous_data['GUID'].apply(self.make_lower)
-        self.movements_data['GUID'] = self.movements_data["GUID"].apply(self.make_lower)
-        self.movements = pd.merge(self.movements_data, self.anonymous_data, on="GUID", how="inner")
+        # GUID -> student resolution, cached per snapshot of the anonymous mapping
+        self.guid_table = GuidTable(anonymous_path, guid_table_dir)
+        self.unmatched_guids, self.unmatched_rows = set(), 0
         self.rename_cols = {
             'НСИ_ИД': 'student_id',
             'Дата': 'date',
@@ -22,12 +24,38 @@ class StudentAnalysis:
             'Направление': 'direction',
             'Допуск': 'access'
         }
+        self.load_movements(movement_path, chunksize)
+
+    def load_movements(self, movement_path, chunksize):
+        if self.student_ids is None:
+            self.movements = self.resolve_students(pd.read_csv(movement_path, encoding='windows-1251', sep=';'))
+        else:
+            self.movements = self.read_sampled_movements(movement_path, chunksize)
 
         self.movements.rename(columns=self.rename_cols, inplace=True)
         self.movements['date'] = pd.to_datetime(self.movements['date'])
 
-    def make_lower(self, x):
-        return str(x).lower()
+    def resolve_students(self, movements):
+        # attach student_id through the resolution table, dropping events of unknown GUIDs
+        # (and of students outside the sample); an event of a GUID with several student
+        # records is kept once for each of them
+        codes, unmatched_guids = self.guid_table.resolve(movements['GUID'])
+        self.unmatched_guids |= unmatched_guids
+        self.unmatched_rows += int((codes < 0).sum())
+
+        rows, entries = self.guid_table.expand(codes)
+        student_ids = self.guid_table.student_ids[entries]
+        if self.student_ids is not None:
+            sampled = pd.Series(student_ids).isin(self.student_ids).to_numpy()
+            rows, student_ids = rows[sampled], student_ids[sampled]
+        movements = movements.iloc[rows].reset_index(drop=True)
+        movements['НСИ_ИД'] = student_ids
+        return movements
+
+    def read_sampled_movements(self, movement_path, chunksize):
+        # stream the export and keep only events of the sampled students
+        chunks = pd.read_csv(movement_path, encoding='windows-1251', sep=';', chunksize=chunksize)
+        return pd.concat([self.resolve_students(chunk) for chunk in chunks], ignore_index=True)
 
     def preprocess_data(self):
         self.target_data['start_date'] = pd.to_datetime(self.target_data['start_date'])
@@ -85,14 +113,43 @@ class StudentAnalysis:
     def extract_features(self, target_path):
         self.target_data = pd.read_csv(target_path)
         self.preprocess_data()
-        # get the filtered data first
+        if self.student_ids is not None:
+            self.target_data = self.target_data[self.target_data['student_id'].isin(self.student_ids)]
+        aggregates = self.aggregate()
+        if aggregates is None:
+            return pd.DataFrame()
+        return self.build_features(aggregates)
+
+    def aggregate(self):
+        # per-id aggregates of the events in each target window, before pivoting
         filtered_data = self.filter_data()
 
         if filtered_data.shape[0] == 0:
-            return pd.DataFrame()
+            return None
 
-        # Extract frequency features for each building
+        # frequency of visits to each building
         grouped_data = filtered_data.groupby(['id', 'building_type']).size().reset_index(name='count')
+
+        # time spent in each building
+        attendance = filtered_data.sort_values(by=['id', 'datetime'])
+        attendance['time_spent'] = attendance.groupby(['id'])['datetime'].shift(-1) - attendance['datetime']
+        attendance['time_spent'] = attendance['time_spent'].dt.total_seconds().fillna(0)
+
+        total_time = attendance.groupby(["id", "building_type"])['time_spent'].sum().abs().reset_index(
+            name="total_time")
+
+        # Extract features for the most visited building
+        visits = filtered_data.groupby(['id'])['building_type'].value_counts().reset_index(name='most_visited')
+
+        # Find the most frequent building type for each GUID and season
+        most_visited = visits.groupby(['id']).apply(lambda x: x.nlargest(1, 'most_visited')).reset_index(
+            drop=True)
+
+        return {'building_count': grouped_data, 'total_time': total_time, 'most_visited': most_visited}
+
+    def build_features(self, aggregates):
+        # Extract frequency features for each building
+        grouped_data = aggregates['building_count']
         filtered_data_building = grouped_data[grouped_data['building_type'].isin(
             ['Academic Building', 'Hostel', 'Cultural Centre', 'Library', 'Sport Complex', 'Main Building'])]
         freq_in_each_building = filtered_data_building.pivot_table(index=['id'], columns='building_type',
@@ -107,12 +164,7 @@ class StudentAnalysis:
         })
 
         # Extract features for time spent in each building
-        attendance = filtered_data.sort_values(by=['id', 'datetime'])
-        attendance['time_spent'] = attendance.groupby(['id'])['datetime'].shift(-1) - attendance['datetime']
-        attendance['time_spent'] = attendance['time_spent'].dt.total_seconds().fillna(0)
-
-        total_time = attendance.groupby(["id", "building_type"])['time_spent'].sum().abs().reset_index(
-            name="total_time")
+        total_time = aggregates['total_time']
         filtered_data_time = total_time[total_time['building_type'].isin(
             ['Academic Building', 'Hostel', 'Cultural Centre', 'Library', 'Sport Complex', 'Main Building'])]
         total_time_each_building = filtered_data_time.pivot_table(index=['id'], columns='building_type',
@@ -131,16 +183,8 @@ class StudentAnalysis:
         # total_time_each_building.drop(columns=['Academic Building', 'Cultural Centre', 'Library', 'Main Building', 'Sport Complex'],inplace=True , axis=1)
         total_time_each_building = self.convert_time_to_hours(total_time_each_building)
 
-        # Extract features for the most visited building
-        grouped_data = filtered_data.groupby(['id'])['building_type'].value_counts().reset_index(name='most_visited')
-
-        # Find the most frequent building type for each GUID and season
-        most_visited = grouped_data.groupby(['id']).apply(lambda x: x.nlargest(1, 'most_visited')).reset_index(
-            drop=True)
-
-        most_visited.rename(columns={"building_type": "most_visited",
-                                     "most_visited": "most_visited_freq"},
-                            inplace=True)
+        most_visited = aggregates['most_visited'].rename(columns={"building_type": "most_visited",
+                                                                  "most_visited": "most_visited_freq"})
 
         # get features from the target_data
         features = self.target_data.loc[self.target_data['student_id'].isin(self.inner_ids)].copy()
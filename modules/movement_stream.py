@@ -0,0 +1,150 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from modules.guid_table import GuidTable
+
+# building types in alphabetical order, so argmax breaks ties like value_counts + nlargest
+BUILDING_TYPES = ['Academic Building', 'Cultural Centre', 'Hostel', 'Library', 'Main Building', 'Sport Complex']
+BUILDINGS = {
+    "Общежитие": "Hostel",
+    "Главный корпус": "Main Building",
+    "Научная Библиотека": "Library",
+    "Центр Культуры": "Cultural Centre",
+    "Спорт.Корпус": "Sport Complex"
+}
+FREQ_COLUMNS = ['freq_academic_building', 'freq_cultural_centre', 'freq_hostel', 'freq_library',
+                'freq_main_building', 'freq_sport_complex']
+TIME_COLUMNS = ['total_time_academic_building', 'total_time_cultural_center', 'total_time_hostel',
+                'total_time_library', 'total_time_main_building', 'total_time_sport']
+NO_EVENT = np.iinfo(np.int64).min
+
+
+class MovementStream:
+    # Running movement aggregates per student, updated from an append-only event file
+    # in the movement CSV schema. Each poll reads only the bytes appended since the last
+    # one, so the current features of a student never need the history again. Events of
+    # a student are expected in time order, as turnstiles write them: an event's dwell
+    # time is the gap to the student's next event, like StudentAnalysis over one window
+    # covering the whole stream. State and file offset are checkpointed together, so a
+    # restart resumes from the checkpoint without counting an event twice. Events whose
+    # date or time does not parse are skipped and counted in `malformed_events`.
+
+    def __init__(self, event_path, anonymous_path, checkpoint_path=None, guid_table_dir=None,
+                 encoding='windows-1251'):
+        self.event_path = Path(event_path)
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.encoding = encoding
+        self.guid_table = GuidTable(anonymous_path, guid_table_dir)
+        # GUIDs of one student share a row of the state; a GUID of several students updates each
+        self.student_of_entry, student_ids = pd.factorize(self.guid_table.student_ids)
+        self.student_ids = pd.Index(student_ids)
+
+        n_students = len(self.student_ids)
+        self.visits = np.zeros((n_students, len(BUILDING_TYPES)), dtype=np.int64)
+        self.dwell = np.zeros((n_students, len(BUILDING_TYPES)), dtype=np.float64)
+        self.last_time = np.full(n_students, NO_EVENT, dtype=np.int64)
+        self.last_building = np.zeros(n_students, dtype=np.int64)
+        self.offset, self.header, self.n_events, self.unmatched_events, self.malformed_events = 0, None, 0, 0, 0
+
+        if self.checkpoint_path is not None and self.checkpoint_path.exists():
+            self.load_checkpoint()
+
+    def load_checkpoint(self):
+        checkpoint = np.load(self.checkpoint_path, allow_pickle=False)
+        # student rows are only valid for the mapping snapshot they were built with
+        if str(checkpoint['snapshot']) != self.guid_table.snapshot:
+            return
+        self.visits, self.dwell = checkpoint['visits'], checkpoint['dwell']
+        self.last_time, self.last_building = checkpoint['last_time'], checkpoint['last_building']
+        # checkpoints written before malformed_events existed have three counters
+        counters = np.zeros(4, dtype=np.int64)
+        counters[:len(checkpoint['counters'])] = checkpoint['counters']
+        self.offset, self.n_events, self.unmatched_events, self.malformed_events = (int(value) for value in counters)
+        self.header = str(checkpoint['header']) or None
+
+    def save_checkpoint(self):
+        # write next to the checkpoint and rename, so a crash never leaves a partial file
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_suffix('.tmp.npz')
+        np.savez(tmp_path, visits=self.visits, dwell=self.dwell, last_time=self.last_time,
+                 last_building=self.last_building, snapshot=self.guid_table.snapshot, header=self.header or '',
+                 counters=np.array([self.offset, self.n_events, self.unmatched_events, self.malformed_events]))
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def poll(self):
+        # read the complete lines appended since the last poll and apply them
+        if not self.event_path.exists():
+            return 0
+        with open(self.event_path, 'rb') as event_file:
+            event_file.seek(self.offset)
+            data = event_file.read()
+        # a line still being written is left for the next poll
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+        text = data[:end].decode(self.encoding)
+
+        header = self.header
+        if header is None:
+            header, _, text = text.partition('\n')
+            header = header.rstrip('\r')
+        applied = self.update(pd.read_csv(io.StringIO(header + '\n' + text), sep=';')) if text.strip() else 0
+        # advance only once the batch is applied, so a failed batch is read again
+        self.offset += end
+        self.header = header
+        return applied
+
+    def update(self, events):
+        # fold a batch of events in the movement CSV schema into the running aggregates;
+        # everything is parsed before the state changes, so a batch is applied whole or not at all
+        times = pd.to_datetime(events['Дата'].astype(str) + ' ' + events['Время'].astype(str),
+                               format='%Y-%m-%d %H:%M:%S', errors='coerce')
+        valid = times.notna().to_numpy()
+        codes, _ = self.guid_table.resolve(events['GUID'])
+        unmatched = int((valid & (codes < 0)).sum())
+        rows, entries = self.guid_table.expand(np.where(valid, codes, -1))
+        self.n_events += len(events)
+        self.unmatched_events += unmatched
+        self.malformed_events += int((~valid).sum())
+        if len(rows) == 0:
+            return 0
+
+        students = self.student_of_entry[entries]
+        buildings = pd.Categorical(events['Корпус'].iloc[rows].map(BUILDINGS).fillna('Academic Building'),
+                                   categories=BUILDING_TYPES).codes.astype(np.int64)
+        times = times.to_numpy()[rows].astype(np.int64)
+        np.add.at(self.visits, (students, buildings), 1)
+
+        # each event closes the previous event of the same student, from this batch or before it
+        order = np.lexsort((times, students))
+        students, buildings, times = students[order], buildings[order], times[order]
+        first = np.r_[True, students[1:] != students[:-1]]
+        previous_time = np.where(first, self.last_time[students], np.r_[NO_EVENT, times[:-1]])
+        previous_building = np.where(first, self.last_building[students], np.r_[0, buildings[:-1]])
+        closes = previous_time != NO_EVENT
+        np.add.at(self.dwell, (students[closes], previous_building[closes]),
+                  (times[closes] - previous_time[closes]) / 1e9)
+
+        last = np.r_[students[1:] != students[:-1], True]
+        self.last_time[students[last]] = times[last]
+        self.last_building[students[last]] = buildings[last]
+        return int((valid & (codes >= 0)).sum())
+
+    def features(self, student_ids=None):
+        # current movement features per student, named like StudentAnalysis.build_features
+        rows = (np.flatnonzero(self.visits.sum(axis=1)) if student_ids is None
+                else self.student_ids.get_indexer(student_ids))
+        rows = rows[rows >= 0]
+        visits, dwell = self.visits[rows], np.abs(self.dwell[rows])
+        features = pd.DataFrame(visits, columns=FREQ_COLUMNS,
+                                index=pd.Index(self.student_ids[rows], name='student_id'))
+        # hours, except the hostel that StudentAnalysis.convert_time_to_hours leaves in seconds
+        hours = np.where(np.array(BUILDING_TYPES) == 'Hostel', 1, 3600)
+        features[TIME_COLUMNS] = dwell / hours
+        most_visited = visits.argmax(axis=1)
+        features.insert(0, 'most_visited', np.array(BUILDING_TYPES)[most_visited])
+        features.insert(1, 'most_visited_freq', visits[np.arange(len(rows)), most_visited])
+        return features
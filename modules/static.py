@@ -7,13 +7,17 @@ warnings.filterwarnings('ignore')
 
 
 class Static:
-    def __init__(self, static_path, target_path):
+    def __init__(self, static_path, target_path, student_ids=None):
         self.static_path = Path(static_path)
+        # optional subset of students used for sampled runs
+        self.student_ids = student_ids
         # self.target_path = Path(target_path)
         self.static_data = pd.read_excel(self.static_path, header=2)
         self.target_data = pd.read_csv(target_path)
         # self.target_data = pd.read_csv(self.target_path)
         self.rename_cols()
+        if self.student_ids is not None:
+            self.static_data = self.static_data[self.static_data['student_id'].isin(self.student_ids)]
         self.static_data['office_enrollment_date'] = pd.to_datetime(self.static_data['office_enrollment_date'],
                                                                     dayfirst=True)
         self.static_data['year_enrollment'] = pd.to_datetime(self.static_data['year_enrollment'], dayfirst=True)
@@ -87,6 +91,13 @@ class Static:
     def get_features(self, target_path):
         self.target_data = pd.read_csv(target_path)
         self.preprocess()
+        if self.student_ids is not None:
+            self.target_data = self.target_data[self.target_data['student_id'].isin(self.student_ids)]
+        self.aggregate()
+        return self.build_features()
+
+    # per-id aggregates of the records in each target window
+    def aggregate(self):
         self.filtered_data = self.filter_data()
         #  let's find the mean entrance score
         self.filtered_data['mean_grade'] = self.filtered_data[['grade_1', 'grade_2', 'grade_3']].mean(axis=1)
@@ -106,11 +117,6 @@ class Static:
 
         # number of enrollment for each  student
         self.num_enrolled = self.filtered_data.groupby(['id', 'enrolled']).size().reset_index(name='count')
-        self.num_enrolled = self.num_enrolled.pivot_table(index='id', columns='enrolled', fill_value=0, values='count')
-        self.num_enrolled.rename(columns={
-            "Да": "num_times_enrolled",
-            "Нет": "num_times_not_enrolled"
-        }, inplace=True)
 
         # number of unique education level
         self.num_unique_edu_level = self.filtered_data.groupby(['id'])[['edu_level']].nunique()
@@ -134,6 +140,13 @@ class Static:
             ["id", "age_at_enrollment", "year_enrollment", "country", "enrolled", "mean_grade"]].drop_duplicates(
             subset="id")
 
+    def build_features(self):
+        self.num_enrolled = self.num_enrolled.pivot_table(index='id', columns='enrolled', fill_value=0, values='count')
+        self.num_enrolled.rename(columns={
+            "Да": "num_times_enrolled",
+            "Нет": "num_times_not_enrolled"
+        }, inplace=True)
+
         # features from target_data
         features = self.target_data.loc[self.target_data['student_id'].isin(self.inner_id)].copy()
 
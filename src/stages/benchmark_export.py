@@ -0,0 +1,169 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier
+from typing import Text
+import yaml
+from src.utils.compiled_model import CompiledModel
+from src.utils.logs import get_logger
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# loads a model in a fresh interpreter and prints load time and peak memory
+STARTUP_SNIPPET = """
+import resource, sys, time
+start = time.perf_counter()
+if sys.argv[2] == 'cbm':
+    from catboost import CatBoostClassifier
+    CatBoostClassifier().load_model(sys.argv[1])
+else:
+    from src.utils.compiled_model import CompiledModel
+    CompiledModel(sys.argv[1], sys.argv[2])
+elapsed = time.perf_counter() - start
+try:
+    # ru_maxrss survives exec on Linux, so it would report the parent's peak
+    with open('/proc/self/status') as status:
+        peak_kb = next(int(line.split()[1]) for line in status if line.startswith('VmHWM'))
+except OSError:
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, peak_kb)
+"""
+
+
+def measure_startup(model_file: Path, export_format: Text) -> dict:
+    """
+    Measure import + load time and peak resident memory in a fresh process.
+
+    Args:
+        model_file (Path): Path to the `.cbm` model.
+        export_format (Text): 'cbm', 'onnx' or 'python'.
+    Returns:
+        dict with startup_s and peak_memory_mb
+    """
+    output = subprocess.run([sys.executable, '-c', STARTUP_SNIPPET, str(model_file), export_format],
+                            cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+    startup, max_rss = output.split()
+    return {'startup_s': float(startup), 'peak_memory_mb': int(max_rss) / 1024}
+
+
+def measure_latency(predict_proba, X: np.ndarray, n_rows: int) -> dict:
+    """
+    Measure single-row latency and batch throughput of a predict function.
+
+    Args:
+        predict_proba: Function scoring a 2D batch.
+        X (np.ndarray): Rows to score.
+        n_rows (int): Number of single-row calls to time.
+    Returns:
+        dict with median per-row latency and batch rows per second
+    """
+    latencies = []
+    for row in X[:n_rows]:
+        start = time.perf_counter()
+        predict_proba(row.reshape(1, -1))
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    predict_proba(X)
+    batch_time = time.perf_counter() - start
+
+    return {'row_latency_ms': float(np.median(latencies)) * 1000, 'batch_rows_per_s': len(X) / batch_time}
+
+
+def benchmark_models(model_dir: Path, test_dir: Path, n_rows: int, logger) -> list:
+    """
+    Compare every exported model in a directory against `CatBoostClassifier.load_model`.
+
+    Args:
+        model_dir (Path): Directory with `catboost_model_{idx}.cbm` files and their exports.
+        test_dir (Path): Directory with the `*_test_set_{idx}.csv` splits to score.
+        n_rows (int): Number of single-row calls to time.
+        logger: Logger object for logging.
+    Returns:
+        list of result dicts, one per model and format
+    """
+    # catboost_model_{idx} was trained on the split *_train_set_{idx}.csv
+    test_files = {int(file.stem.rsplit('_', 1)[1]): file for file in test_dir.glob("*_test_set_*.csv")
+                  if file.stem.rsplit('_', 1)[1].isdigit()}
+
+    results = []
+    for model_file in sorted(model_dir.glob("catboost_model_*.cbm")):
+        meta_file = model_file.with_suffix('.json')
+        if not meta_file.exists():
+            continue
+        with open(meta_file) as f:
+            meta = json.load(f)
+        formats = [fmt for fmt in meta['formats'] if fmt in ('onnx', 'python')]
+        if not formats:
+            logger.info(f"{model_file} has no standalone export. Skipping...")
+            continue
+
+        test_file = test_files.get(int(model_file.stem.rsplit('_', 1)[1]))
+        if test_file is None:
+            logger.warning(f"No test split for {model_file}. Skipping...")
+            continue
+        test_data = pd.read_csv(test_file)
+        # an export left over from an older run can expect columns the current split lacks
+        missing = [col for col in meta['feature_names'] if col not in test_data.columns]
+        if missing:
+            logger.warning(f"{test_file} lacks features {missing} of {model_file}. Skipping...")
+            continue
+
+        X = test_data[meta['feature_names']].to_numpy(dtype=object)
+        model = CatBoostClassifier()
+        model.load_model(model_file)
+        baseline = model.predict_proba(pd.DataFrame(X, columns=meta['feature_names']))
+
+        candidates = {'cbm': lambda batch: model.predict_proba(pd.DataFrame(batch, columns=meta['feature_names']))}
+        for export_format in formats:
+            candidates[export_format] = CompiledModel(model_file, export_format).predict_proba
+
+        for export_format, predict_proba in candidates.items():
+            result = {'model': str(model_file), 'format': export_format}
+            result.update(measure_startup(model_file, export_format))
+            result.update(measure_latency(predict_proba, X, n_rows))
+            result['max_abs_diff'] = float(np.abs(predict_proba(X) - baseline).max())
+            logger.info(f"{model_file.name} [{export_format}]: startup {result['startup_s']:.3f}s, "
+                        f"memory {result['peak_memory_mb']:.0f}MB, row latency {result['row_latency_ms']:.3f}ms, "
+                        f"batch {result['batch_rows_per_s']:.0f} rows/s")
+            results.append(result)
+
+    return results
+
+
+def benchmark_export(config_path: Text, n_rows: int) -> None:
+    # Load configuration file
+    with open(config_path, 'r') as config_file:
+        config = yaml.safe_load(config_file)
+
+    logger = get_logger("BENCHMARK EXPORT", log_level=config['base']['log_level'])
+
+    sources = [
+        ('attest_model', 'attestation_data_test'),
+        ('movement_model', 'movement_data_test'),
+        ('static_model', 'static_data_test')
+    ]
+    for model_key, test_key in sources:
+        model_dir = Path(config['model_save_path'][model_key])
+        test_dir = Path(config['train_test_split']['test_set'][test_key])
+        logger.info(f"Benchmarking exported models in {model_dir}")
+        results = benchmark_models(model_dir, test_dir, n_rows, logger)
+
+        if results:
+            report_path = model_dir / "export_benchmark.json"
+            with open(report_path, 'w') as report_file:
+                json.dump(results, report_file, indent=4)
+            logger.info(f"Benchmark saved to {report_path}")
+
+
+if __name__ == "__main__":
+    args_parser = argparse.ArgumentParser(description="Benchmark exported CatBoost models")
+    args_parser.add_argument("--config_path", type=str, required=False, default="/Users/macbookpro/Desktop/my_student_retention_exp/params.yaml", help="Path of the config script")
+    args_parser.add_argument("--n_rows", type=int, required=False, default=200, help="Number of single-row predictions to time")
+    args = args_parser.parse_args()
+    benchmark_export(config_path=args.config_path, n_rows=args.n_rows)
@@ -0,0 +1,104 @@
+import argparse
+import pandas as pd
+from typing import Text
+import yaml
+from src.utils.logs import get_logger
+from pathlib import Path
+
+
+def load_source(feature_file: Path) -> pd.DataFrame:
+    """
+    Load one source's features indexed and sorted by the target row `id`.
+
+    Args:
+        feature_file (Path): Path to a feature csv written by the featurize stage.
+    Returns:
+        pd.DataFrame indexed by `id`, or an empty frame if the file is missing or empty
+    """
+    if not feature_file.exists():
+        return pd.DataFrame()
+    data = pd.read_csv(feature_file, index_col=0)
+    if data.empty:
+        return data
+    return data.set_index('id').sort_index()
+
+
+def combine_sources(sources: dict) -> pd.DataFrame:
+    """
+    Join the features of several sources for one target into one wide frame.
+
+    Columns present in every non-empty source come from the target file and are
+    kept once. Every row of any source is kept, and `has_<source>` marks which
+    sources cover it.
+
+    Args:
+        sources (dict): Source name -> features indexed and sorted by `id`.
+    Returns:
+        pd.DataFrame indexed by `id`
+    """
+    frames = {name: data for name, data in sources.items() if not data.empty}
+    shared_columns = [col for col in next(iter(frames.values())).columns
+                      if all(col in data.columns for data in frames.values())]
+
+    # target-derived columns, taken once per id from whichever source has the row
+    combined = pd.concat([data[shared_columns] for data in frames.values()])
+    combined = combined[~combined.index.duplicated(keep='first')].sort_index()
+
+    seen_columns = set(shared_columns)
+    for name in sources:
+        data = frames.get(name)
+        combined[f'has_{name}'] = combined.index.isin(data.index).astype('int8') if data is not None else 0
+        if data is None:
+            continue
+        own = data.drop(columns=shared_columns)
+        # keep columns that more than one source produces apart
+        own = own.rename(columns={col: f'{name}_{col}' for col in own.columns if col in seen_columns})
+        seen_columns.update(own.columns)
+        # both indexes are sorted and unique, so pandas joins them with a merge join
+        combined = combined.join(own, how='left')
+
+    return combined
+
+
+def combine(config_path: Text) -> None:
+    # Load configuration file
+    with open(config_path, 'r') as config_file:
+        config = yaml.safe_load(config_file)
+
+    # Initialize logger
+    logger = get_logger("COMBINE", log_level=config['base']['log_level'])
+
+    feature_dirs = {
+        'attestation': (Path(config['featurize']['attestation_features']), 'attest_features'),
+        'movement': (Path(config['featurize']['movement_features']), 'movement_features'),
+        'static': (Path(config['featurize']['static_features']), 'static_features')
+    }
+    combined_base_path = Path(config['featurize']['combined_features'])
+    combined_base_path.mkdir(parents=True, exist_ok=True)
+
+    # feature files of every source share the index of the target file they came from
+    indexes = sorted({int(file.stem.rsplit('_', 1)[1])
+                      for feature_dir, prefix in feature_dirs.values() for file in feature_dir.glob(f"{prefix}_*.csv")})
+    logger.info(f"Found features for {len(indexes)} targets")
+
+    for idx in indexes:
+        sources = {name: load_source(feature_dir / f"{prefix}_{idx}.csv")
+                   for name, (feature_dir, prefix) in feature_dirs.items()}
+        if all(data.empty for data in sources.values()):
+            logger.warning(f"No features for target {idx}. Skipping...")
+            continue
+
+        combined = combine_sources(sources)
+        coverage = ", ".join(f"{name}: {combined[f'has_{name}'].sum()}" for name in sources)
+        logger.info(f"Combined target {idx}: {len(combined)} rows, {combined.shape[1]} columns ({coverage})")
+
+        combined_path = combined_base_path / f"combined_features_{idx}.parquet"
+        combined.reset_index().to_parquet(combined_path, index=False)
+        logger.info(f"Saved combined features to {combined_path}")
+
+
+if __name__ == "__main__":
+    args_parser = argparse.ArgumentParser(description="Combine feature sources")
+    args_parser.add_argument("--config_path", type=str, required=False, default="/Users/macbookpro/Desktop/my_student_retention_exp/params.yaml", help="Path of the config script")
+    args = args_parser.parse_args()
+    combine(config_path=args.config_path)
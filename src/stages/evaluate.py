@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier, Pool
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+from typing import Text
+import yaml
+from src.utils.logs import ProgressLogger, get_logger, start_log_listener
+
+
+def predict_batches(model: CatBoostClassifier, X: pd.DataFrame, batch_size: int, n_jobs: int):
+    """
+    Score a test split in batches spread over a thread pool.
+
+    Args:
+        model (CatBoostClassifier): Trained model.
+        X (pd.DataFrame): Features in the model's column order.
+        batch_size (int): Rows per batch.
+        n_jobs (int): Batches scored at the same time.
+    Returns:
+        tuple of (positive class probabilities, per-batch latencies in seconds, wall time in seconds)
+    """
+    cat_features = model.get_cat_feature_indices()
+    text_features = model.get_text_feature_indices()
+    # split the cores between the batches running at the same time
+    thread_count = max(1, (os.cpu_count() or 1) // n_jobs)
+
+    def score(batch: pd.DataFrame):
+        start = time.perf_counter()
+        pool = Pool(batch, cat_features=cat_features, text_features=text_features)
+        probabilities = model.predict_proba(pool, thread_count=thread_count)[:, 1]
+        return probabilities, time.perf_counter() - start
+
+    batches = [X.iloc[start:start + batch_size] for start in range(0, len(X), batch_size)]
+    start = time.perf_counter()
+    # CatBoost releases the GIL while predicting, so threads share the loaded model
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        results = list(executor.map(score, batches))
+    wall_time = time.perf_counter() - start
+
+    return np.concatenate([probabilities for probabilities, _ in results]), [latency for _, latency in results], wall_time
+
+
+def score_predictions(y_true: np.ndarray, probabilities: np.ndarray, threshold: float = 0.5) -> dict:
+    """
+    Compute classification metrics for one set of predictions.
+
+    Args:
+        y_true (np.ndarray): True labels.
+        probabilities (np.ndarray): Predicted probabilities of the positive class.
+        threshold (float): Probability above which a row is labelled positive.
+    Returns:
+        dict with roc_auc (None when the labels have a single class), f1 and accuracy
+    """
+    y_pred = (probabilities > threshold).astype(int)
+    return {
+        'roc_auc': float(roc_auc_score(y_true, probabilities)) if len(np.unique(y_true)) > 1 else None,
+        'f1': float(f1_score(y_true, y_pred, zero_division=0)),
+        'accuracy': float(accuracy_score(y_true, y_pred))
+    }
+
+
+def evaluate_models(model_dir: Path, test_dir: Path, target_column: Text, batch_size: int, n_jobs: int,
+                    logger) -> dict:
+    """
+    Score every `catboost_model_{idx}.cbm` in a directory on its `*_test_set_{idx}.csv`.
+
+    Args:
+        model_dir (Path): Directory with the saved models.
+        test_dir (Path): Directory with the test splits.
+        target_column (Text): Target column name.
+        batch_size (int): Rows per prediction batch.
+        n_jobs (int): Batches scored at the same time.
+        logger: Logger object for logging.
+    Returns:
+        dict with the results per model and the metrics over all test rows of the source
+    """
+    test_files = {int(file.stem.rsplit('_', 1)[1]): file for file in test_dir.glob("*_test_set_*.csv")
+                  if file.stem.rsplit('_', 1)[1].isdigit()}
+    model_files = sorted((file for file in model_dir.glob("catboost_model_*.cbm")
+                          if file.stem.rsplit('_', 1)[1].isdigit()),
+                         key=lambda file: int(file.stem.rsplit('_', 1)[1]))
+
+    results, all_true, all_probabilities = [], [], []
+    progress = ProgressLogger(logger, len(model_files), f"Models in {model_dir.name}")
+    for model_file in model_files:
+        try:
+            idx = int(model_file.stem.rsplit('_', 1)[1])
+            test_file = test_files.get(idx)
+            if test_file is None:
+                logger.warning(f"No test split for {model_file}. Skipping...")
+                continue
+
+            start = time.perf_counter()
+            model = CatBoostClassifier()
+            model.load_model(model_file)
+            load_time = time.perf_counter() - start
+
+            data = pd.read_csv(test_file)
+            if data.empty or target_column not in data.columns:
+                logger.warning(f"Test split {test_file} has no rows or no '{target_column}' column. Skipping...")
+                continue
+            # a model left over from an older run can expect columns the current split lacks
+            missing = [col for col in model.feature_names_ if col not in data.columns]
+            if missing:
+                logger.warning(f"{test_file} lacks features {missing} of {model_file}. Skipping...")
+                continue
+            X, y = data[model.feature_names_], data[target_column].to_numpy()
+
+            probabilities, latencies, wall_time = predict_batches(model, X, batch_size, n_jobs)
+            result = {
+                'model': str(model_file),
+                'test_file': str(test_file),
+                'n_rows': len(data),
+                **score_predictions(y, probabilities),
+                'load_s': load_time,
+                'rows_per_s': len(data) / wall_time,
+                'batch_latency_ms_p50': float(np.percentile(latencies, 50)) * 1000,
+                'batch_latency_ms_p95': float(np.percentile(latencies, 95)) * 1000
+            }
+            roc_auc = f"{result['roc_auc']:.4f}" if result['roc_auc'] is not None else 'n/a'
+            logger.info(f"{model_file.name}: ROC-AUC {roc_auc}, F1 {result['f1']:.4f}, "
+                        f"accuracy {result['accuracy']:.4f}, {result['rows_per_s']:.0f} rows/s")
+            results.append(result)
+            all_true.append(y)
+            all_probabilities.append(probabilities)
+
+        except Exception as e:
+            logger.error(f"Error evaluating model {model_file}: {e}")
+        finally:
+            progress.update()
+
+    overall = score_predictions(np.concatenate(all_true), np.concatenate(all_probabilities)) if results else None
+    return {'models': results, 'overall': overall}
+
+
+def evaluate(config_path: Text) -> None:
+    # Load configuration file
+    with open(config_path, 'r') as config_file:
+        config = yaml.safe_load(config_file)
+
+    logger = get_logger("EVALUATE", log_level=config['base']['log_level'])
+
+    target_column = config['train']['target_column']
+    batch_size = config['evaluate']['batch_size']
+    n_jobs = config['evaluate']['n_jobs']
+
+    sources = {
+        'attestation': ('attest_model', 'attestation_data_test'),
+        'movement': ('movement_model', 'movement_data_test'),
+        'static': ('static_model', 'static_data_test')
+    }
+    report = {}
+    for source, (model_key, test_key) in sources.items():
+        model_dir = Path(config['model_save_path'][model_key])
+        test_dir = Path(config['train_test_split']['test_set'][test_key])
+        logger.info(f"Evaluating {source} models in {model_dir}")
+        report[source] = evaluate_models(model_dir, test_dir, target_column, batch_size, n_jobs, logger)
+
+    report_path = Path(config['evaluate']['report_path'])
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=4)
+    logger.info(f"Evaluation report saved to {report_path}")
+
+
+if __name__ == "__main__":
+    args_parser = argparse.ArgumentParser(description="Evaluate CatBoost models on the test splits")
+    args_parser.add_argument("--config_path", type=str, required=False, default="/Users/macbookpro/Desktop/my_student_retention_exp/params.yaml", help="Path of the config script")
+    args = args_parser.parse_args()
+    listener = start_log_listener()
+    try:
+        evaluate(config_path=args.config_path)
+    finally:
+        listener.stop()
@@ -1,24 +1,78 @@
 import argparse
+import json
 import pandas as pd
+from scipy import sparse
 from typing import Text
 import yaml
-from src.utils.logs import get_logger
+from src.utils.logs import ProgressLogger, get_logger, start_log_listener
 from modules.attestation import Attestation
 from modules.movement import StudentAnalysis
 from modules.static import Static
 from pathlib import Path
+from functools import partial
 
 
-def featurize(config_path: Text) -> None:
+def sample_students(target_list: list, target_column: Text, random_state: int,
+                    sample_fraction: float = None, sample_students: int = None) -> set:
+    """Pick a deterministic, dropout-stratified subset of students from the target files.
+    Args:
+        target_list {list}: paths to target csv files
+        target_column {Text}: name of the dropout label column
+        random_state {int}: seed for the sampling
+        sample_fraction {float}: share of students to keep
+        sample_students {int}: number of students to keep; used when sample_fraction is not set
+    Returns:
+        set of sampled student ids
+    """
+    targets = pd.concat([pd.read_csv(target, usecols=['student_id', target_column]) for target in target_list],
+                        ignore_index=True)
+    # a student counts as a dropout if any of the windows marks them so
+    students = targets.groupby('student_id')[target_column].max().reset_index()
+
+    if sample_fraction is None:
+        sample_fraction = min(1.0, sample_students / len(students))
+
+    sampled = students.groupby(target_column).sample(frac=sample_fraction, random_state=random_state)
+    return set(sampled['student_id'])
+
+
+def report_duplicates(duplicate_counts: dict, logger) -> None:
+    """Log how many duplicate attestation records each workbook contributed.
+    Args:
+        duplicate_counts {dict}: workbook name -> number of dropped records
+        logger: logger to report to
+    """
+    for workbook, count in duplicate_counts.items():
+        if count:
+            logger.info(f"Dropped {count} duplicate attestation records from {workbook}")
+    logger.info(f"Dropped {sum(duplicate_counts.values())} duplicate attestation records in total")
+
+
+def featurize(config_path: Text, sample_fraction: float = None, n_sample_students: int = None) -> None:
     """Create new features.
     Args:
         config_path {Text}: path to config
+        sample_fraction {float}: build features for this share of students only
+        n_sample_students {int}: build features for this number of students only
     """
     with open(config_path) as conf_file:
         config = yaml.safe_load(conf_file)
 
     logger = get_logger('FEATURIZE', log_level=config['base']['log_level'])
 
+    # pick the extractor implementations: in-memory pandas or out-of-core DuckDB
+    backend = config['featurize']['backend']
+    if backend == 'duckdb':
+        from modules.duckdb_backend import DuckDBAttestation, DuckDBStatic, DuckDBStudentAnalysis
+
+        settings = config['featurize']['duckdb']
+        attestation_cls = partial(DuckDBAttestation, settings=settings)
+        movement_cls = partial(DuckDBStudentAnalysis, settings=settings)
+        static_cls = partial(DuckDBStatic, settings=settings)
+    else:
+        attestation_cls, movement_cls, static_cls = Attestation, StudentAnalysis, Static
+    logger.info(f"Using the {backend} feature backend")
+
     logger.info('Load raw attestation data')
     attest_data_path = Path(config['data_load']['attest_data_csv'])
     # target_data_path = Path(config['data_load']['targets_data_csv'])
@@ -27,35 +81,92 @@ def featurize(config_path: Text) -> None:
     
     # loop through the data in the targets path use each to combine with attestation
     target_list = list(target_data_path.glob("*.csv"))
-    
+    if not target_list:
+        logger.warning(f"No target files in {target_data_path}, no features will be built")
+        return
+
+    # restrict every raw source to a sample of students for fast development runs
+    student_ids = None
+    sampled = sample_fraction is not None or n_sample_students is not None
+    if sampled:
+        student_ids = sample_students(target_list, config['train']['target_column'],
+                                      config['base']['random_state'], sample_fraction, n_sample_students)
+        logger.warning(f"Sampled run: features are built for {len(student_ids)} students only "
+                       f"and saved under {config['featurize']['sample_output_dir']}")
+
+    def feature_dir(key: Text) -> Path:
+        # sampled runs get their own directories, so they never replace the full-data features
+        path = Path(config['featurize'][key])
+        if sampled:
+            path = Path(config['featurize']['sample_output_dir']) / path.name
+            path.mkdir(parents=True, exist_ok=True)
+        return path
+
     # Assume `config` is loaded with the paths from params.yaml
-    attest_base_path = Path(config['featurize']['attestation_features'])
+    attest_base_path = feature_dir('attestation_features')
 
     # Ensure the directory exists
     attest_base_path.mkdir(parents=True, exist_ok=True)
 
+    # nested target windows can share one pass over the attestation records
+    incremental = config['featurize']['attestation_incremental'] and backend == 'pandas'
+    discipline_settings = config['featurize']['discipline_matrix']
+    if incremental:
+        logger.info("Aggregating attestation features incrementally across target windows")
+        attestation = Attestation(attest_data_path, target_list[0], student_ids)
+        report_duplicates(attestation.duplicate_counts, logger)
+        if discipline_settings['enabled']:
+            attestation.set_discipline_space(discipline_settings['projection'], discipline_settings['n_features'])
+        incremental_features = attestation.extract_features_incremental(target_list)
+
     # Process and save each extracted attestation feature set
+    progress = ProgressLogger(logger, len(target_list), "Attestation targets")
     for i, target in enumerate(target_list):
-        attestation = Attestation(attest_data_path, target)
-        attest_features = attestation.extract_features(target)
+        if incremental:
+            attest_features = incremental_features[i]
+        else:
+            attestation = attestation_cls(attest_data_path, target, student_ids)
+            if i == 0:
+                report_duplicates(attestation.duplicate_counts, logger)
+            if discipline_settings['enabled']:
+                attestation.set_discipline_space(discipline_settings['projection'], discipline_settings['n_features'])
+            attest_features = attestation.extract_features(target)
+
+        # sparse per-discipline outcome counts, rows aligned with the dense features
+        if discipline_settings['enabled'] and not attest_features.empty:
+            matrix = attestation.discipline_matrix(attest_features, i if incremental else None)
+            sparse.save_npz(attest_base_path / f"attest_disciplines_{i}.npz", matrix)
+            with open(attest_base_path / f"attest_disciplines_{i}.json", 'w') as columns_file:
+                json.dump(attestation.discipline_columns, columns_file, ensure_ascii=False)
+            logger.debug(f"Saved {matrix.shape} discipline matrix with {matrix.nnz} non-zeros")
         
         # Dynamically construct the feature path using the base path and index
         feature_file_path = attest_base_path / f"attest_features_{i}.csv"
         
         # Save the extracted features to the constructed path
         attest_features.to_csv(feature_file_path)
-        print(f"Saved attestation features to {feature_file_path}")
+        logger.debug(f"Saved attestation features to {feature_file_path}")
+        progress.update()
     logger.info("Attestation Features Successfully Loaded")
 
     logger.info("Load movement data")
     movement_data_path = Path(config['data_load']['movement_data_csv'])
     anonymous_data_path = Path(config['data_load']['anonymous_data_csv'])/"СоответствияИД.xlsx"
+    guid_table_dir = Path(config['featurize']['guid_tables'])
     # for the movement path
-    movement_base_path = Path(config['featurize']['movement_features'])
+    movement_base_path = feature_dir('movement_features')
     
     # extract features for each semester of movement data
+    progress = ProgressLogger(logger, len(target_list), "Movement targets")
     for i, target in enumerate(target_list):
-        movement = StudentAnalysis(movement_data_path, anonymous_data_path, target)
+        movement = movement_cls(movement_data_path, anonymous_data_path, target, student_ids,
+                                guid_table_dir=guid_table_dir)
+        if i == 0 and movement.unmatched_guids:
+            logger.warning(f"{len(movement.unmatched_guids)} movement GUIDs ({movement.unmatched_rows} events) "
+                           f"are missing from {anonymous_data_path.name}")
+        if i == 0 and len(movement.guid_table.multi_student_guids):
+            logger.warning(f"{len(movement.guid_table.multi_student_guids)} GUIDs in {anonymous_data_path.name} "
+                           f"map to more than one student; their events count for each of them")
         movement_features = movement.extract_features(target)
         
         # construct path to save features
@@ -63,25 +174,28 @@ def featurize(config_path: Text) -> None:
         
         # save the features to the path
         movement_features.to_csv(movement_features_path)
-        print(f"Saved movement features to {movement_features_path}")
+        logger.debug(f"Saved movement features to {movement_features_path}")
+        progress.update()
     logger.info("Movements Features Extracted and Saved")
     
     logger.info("Extracting Features for static data")
     # for static path
     static_data_path = Path(config['data_load']['static_data_csv'])
     # for static features base path
-    static_base_path = Path(config['featurize']['static_features'])
+    static_base_path = feature_dir('static_features')
     
     # extract features for static data
+    progress = ProgressLogger(logger, len(target_list), "Static targets")
     for i, target in enumerate(target_list):
-        static = Static(static_data_path, target)
+        static = static_cls(static_data_path, target, student_ids)
         static_features = static.get_features(target)
         
         static_features_path = static_base_path / f"static_features_{i}.csv"
         
         # save the  features to the path specified
         static_features.to_csv(static_features_path)
-        print(f"Saved static features to {static_features_path}")
+        logger.debug(f"Saved static features to {static_features_path}")
+        progress.update()
     logger.info("Static Features Extracted and Saved")
 
             
@@ -107,7 +221,19 @@ if __name__ == '__main__':
     args_parser.add_argument('--anonymous_data_path', type=str, required=False,
                              default="data/raw/anonymous_data", help='path to anonymous data')
     
+    sample_group = args_parser.add_mutually_exclusive_group()
+    sample_group.add_argument('--sample-fraction', type=float, required=False, default=None,
+                              help="build features for a stratified share of students (development runs)")
+    sample_group.add_argument('--sample-students', type=int, required=False, default=None,
+                              help="build features for a stratified number of students (development runs)")
+    
     args = args_parser.parse_args()
 
-    # Use args.config_path instead of args.config
-    featurize(config_path=args.config_path)
+    # write logs from a background thread so extraction never blocks on stdout
+    listener = start_log_listener()
+    try:
+        # Use args.config_path instead of args.config
+        featurize(config_path=args.config_path, sample_fraction=args.sample_fraction,
+                  n_sample_students=args.sample_students)
+    finally:
+        listener.stop()
@@ -0,0 +1,61 @@
+import argparse
+import time
+from pathlib import Path
+from typing import Text
+import yaml
+from modules.movement_stream import MovementStream
+from src.utils.logs import get_logger, start_log_listener
+
+
+def stream_movements(config_path: Text, once: bool = False) -> None:
+    # Load configuration file
+    with open(config_path, 'r') as config_file:
+        config = yaml.safe_load(config_file)
+
+    logger = get_logger("STREAM MOVEMENTS", log_level=config['base']['log_level'])
+
+    settings = config['stream']
+    anonymous_data_path = Path(config['data_load']['anonymous_data_csv']) / "СоответствияИД.xlsx"
+    stream = MovementStream(settings['event_path'], anonymous_data_path, settings['checkpoint_path'],
+                            guid_table_dir=config['featurize']['guid_tables'])
+    if len(stream.guid_table.multi_student_guids):
+        logger.warning(f"{len(stream.guid_table.multi_student_guids)} GUIDs in {anonymous_data_path.name} "
+                       f"map to more than one student; their events count for each of them")
+    logger.info(f"Tailing {settings['event_path']} from byte {stream.offset} ({stream.n_events} events applied)")
+
+    last_checkpoint = time.monotonic()
+    try:
+        while True:
+            applied = stream.poll()
+            if applied:
+                logger.debug(f"Applied {applied} events, {stream.n_events} in total")
+
+            now = time.monotonic()
+            if now - last_checkpoint >= settings['checkpoint_interval']:
+                stream.save_checkpoint()
+                last_checkpoint = now
+                logger.info(f"Checkpoint at byte {stream.offset}: {stream.n_events} events, "
+                            f"{stream.unmatched_events} without a student mapping, "
+                            f"{stream.malformed_events} malformed")
+
+            if once and not applied:
+                break
+            if not applied:
+                time.sleep(settings['poll_interval'])
+    except KeyboardInterrupt:
+        logger.info("Stopping")
+    finally:
+        stream.save_checkpoint()
+        logger.info(f"Saved state of {stream.n_events} events to {settings['checkpoint_path']}")
+
+
+if __name__ == "__main__":
+    args_parser = argparse.ArgumentParser(description="Update movement features from an append-only event file")
+    args_parser.add_argument("--config_path", type=str, required=False, default="/Users/macbookpro/Desktop/my_student_retention_exp/params.yaml", help="Path of the config script")
+    args_parser.add_argument("--once", action="store_true", help="Apply the events written so far and exit")
+    args = args_parser.parse_args()
+    listener = start_log_listener()
+    try:
+        stream_movements(config_path=args.config_path, once=args.once)
+    finally:
+        listener.stop()
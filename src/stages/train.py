@@ -1,10 +1,302 @@
 import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from catboost import CatBoostClassifier
+from catboost import CatBoostClassifier, CatBoostError, Pool
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import ParameterSampler, train_test_split
 from typing import Text
 import yaml
-from src.utils.logs import get_logger
+from src.utils.logs import ProgressLogger, get_logger, start_log_listener
+
+
+def make_pools(X: pd.DataFrame, y: pd.Series, cat_features: list, text_features: list,
+               validation_size: float, random_state: int):
+    """
+    Split features into train/validation parts and wrap each in a CatBoost Pool.
+
+    The pools are built once per training file so every trial of a search reuses
+    the same loaded data instead of re-reading the CSV.
+
+    Args:
+        X (pd.DataFrame): Feature matrix.
+        y (pd.Series): Target values.
+        cat_features (list): Categorical feature names.
+        text_features (list): Text feature names.
+        validation_size (float): Share of rows held out for early stopping.
+        random_state (int): Seed for the split.
+    Returns:
+        tuple of (train_pool, validation_pool)
+    """
+    X_train, X_val, y_train, y_val = train_test_split(
+        X, y, test_size=validation_size, random_state=random_state, stratify=y
+    )
+    train_pool = Pool(X_train, y_train, cat_features=cat_features, text_features=text_features)
+    val_pool = Pool(X_val, y_val, cat_features=cat_features, text_features=text_features)
+    return train_pool, val_pool
+
+
+def fit_trial(params: dict, train_pool: Pool, val_pool: Pool, early_stopping_rounds: int,
+              stopping_metric: str = None):
+    """
+    Fit one CatBoost model with early stopping on the validation pool.
+
+    Early stopping and the best iteration follow `stopping_metric` when it is set;
+    the `eval_metric` of `params` is then only reported, as a custom metric.
+
+    Args:
+        params (dict): Parameters for CatBoostClassifier (without text_features).
+        train_pool (Pool): Training data.
+        val_pool (Pool): Validation data used for early stopping.
+        early_stopping_rounds (int): Rounds without improvement before stopping.
+        stopping_metric (str): Metric watched for early stopping; `eval_metric` when None.
+    Returns:
+        fitted CatBoostClassifier
+    """
+    # parallel trials would all write to the same catboost_info in the working directory
+    fit_params = {**params, 'allow_writing_files': False}
+    if stopping_metric:
+        fit_params['eval_metric'] = stopping_metric
+        if params.get('eval_metric', stopping_metric) != stopping_metric:
+            fit_params['custom_metric'] = [params['eval_metric']]
+    model = CatBoostClassifier(**fit_params)
+    model.fit(train_pool, eval_set=val_pool, early_stopping_rounds=early_stopping_rounds,
+              use_best_model=True, verbose=0)
+    return model
+
+
+def validation_score(model: CatBoostClassifier, metric: str) -> float:
+    """
+    Value of a metric on the validation pool at the iteration the model keeps.
+
+    Args:
+        model (CatBoostClassifier): Model fitted by `fit_trial`.
+        metric (str): Its eval_metric or custom metric.
+    Returns:
+        float value of the metric
+    """
+    # with class weights a custom metric is logged with and without them; like an
+    # eval_metric, the weighted value is used
+    results = model.get_evals_result()['validation']
+    values = results.get(metric, results.get(f"{metric}:use_weights=true"))
+    return values[model.get_best_iteration()]
+
+
+def tune_model(
+    train_pool: Pool,
+    val_pool: Pool,
+    model_params: dict,
+    tuning: dict,
+    early_stopping_rounds: int,
+    random_state: int,
+    logger,
+    stopping_metric: str = None
+):
+    """
+    Run a parallel random search over CatBoost parameters for one training file.
+
+    Each trial starts from `model_params`, overrides the sampled values, stops
+    early on `stopping_metric` and is scored on the validation pool by the
+    model's `eval_metric`.
+
+    Args:
+        train_pool (Pool): Training data shared by all trials.
+        val_pool (Pool): Validation data shared by all trials.
+        model_params (dict): Base parameters for CatBoostClassifier.
+        tuning (dict): Search settings (param_grid, n_trials, n_jobs, maximize).
+        early_stopping_rounds (int): Rounds without improvement before stopping.
+        random_state (int): Seed for parameter sampling.
+        logger: Logger object for logging.
+        stopping_metric (str): Metric watched for early stopping; `eval_metric` when None.
+    Returns:
+        tuple of (best_model, best_params, best_score)
+    """
+    n_jobs = tuning.get('n_jobs', 1)
+    maximize = tuning.get('maximize', True)
+    eval_metric = model_params.get('eval_metric', 'Logloss')
+    # split the cores between the trials running at the same time
+    thread_count = max(1, (os.cpu_count() or 1) // n_jobs)
+
+    candidates = list(ParameterSampler(tuning['param_grid'], n_iter=tuning.get('n_trials', 10),
+                                       random_state=random_state))
+    trial_params = [{**model_params, **candidate, 'thread_count': thread_count,
+                     'random_seed': random_state} for candidate in candidates]
+    logger.info(f"Running {len(trial_params)} trials with {n_jobs} parallel workers")
+
+    # CatBoost releases the GIL while fitting, so threads keep the pools shared
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        models = list(executor.map(
+            lambda params: fit_trial(params, train_pool, val_pool, early_stopping_rounds, stopping_metric),
+            trial_params))
+
+    best_model, best_params, best_score = None, None, None
+    for candidate, model in zip(candidates, models):
+        score = validation_score(model, eval_metric)
+        logger.debug(f"Trial {candidate}: {eval_metric}={score:.4f}, best_iteration={model.get_best_iteration()}")
+        if best_score is None or (score > best_score if maximize else score < best_score):
+            best_model, best_params, best_score = model, candidate, score
+
+    return best_model, best_params, best_score
+
+
+def predict_time(model: CatBoostClassifier, pool: Pool, repeats: int = 5) -> float:
+    """
+    Median wall time of scoring a whole pool.
+
+    Args:
+        model (CatBoostClassifier): Trained model.
+        pool (Pool): Data to score.
+        repeats (int): Number of timed runs.
+    Returns:
+        float seconds
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_proba(pool)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def prune_model(
+    model: CatBoostClassifier,
+    params: dict,
+    X: pd.DataFrame,
+    y: pd.Series,
+    cat_features: list,
+    text_features: list,
+    pruning: dict,
+    validation_size: float,
+    early_stopping_rounds: int,
+    stopping_metric: str,
+    random_state: int,
+    logger
+):
+    """
+    Retrain a model on the features that carry most of its importance.
+
+    Features are ranked by CatBoost's feature importance and kept until their
+    share of the total reaches `cumulative_importance`. To compare the two
+    feature sets, a holdout split is set aside that no model sees for training
+    or for picking its iteration. A full and a pruned model are then refit
+    alone with the same parameters on the remaining rows and scored on the
+    holdout. The pruned model replaces the full one unless its holdout accuracy
+    drops by more than `max_accuracy_drop`. In that case it is retrained on the
+    same split as the full model.
+
+    Args:
+        model (CatBoostClassifier): Model trained on all features.
+        params (dict): Parameters the model was trained with (without text_features).
+        X (pd.DataFrame): Feature matrix.
+        y (pd.Series): Target values.
+        cat_features (list): Categorical feature names.
+        text_features (list): Text feature names.
+        pruning (dict): Pruning settings (cumulative_importance, max_accuracy_drop).
+        validation_size (float): Share of rows held out for early stopping and for the holdout.
+        early_stopping_rounds (int): Rounds without improvement before stopping.
+        stopping_metric (str): Metric watched for early stopping; `eval_metric` when None.
+        random_state (int): Seed for the splits.
+        logger: Logger object for logging.
+    Returns:
+        tuple of (model to ship, its train pool or None for the full model, report dict)
+    """
+    importances = pd.Series(model.get_feature_importance(), index=model.feature_names_).sort_values(ascending=False)
+    share = (importances.cumsum() / importances.sum()).to_numpy()
+    n_keep = min(len(importances), int(np.searchsorted(share, pruning['cumulative_importance'])) + 1)
+    keep = set(importances.index[:n_keep])
+    kept = [col for col in X.columns if col in keep]
+    logger.info(f"Pruning to {len(kept)} of {X.shape[1]} features "
+                f"({pruning['cumulative_importance']:.0%} of the importance)")
+
+    def feature_kwargs(columns):
+        return {'cat_features': [col for col in cat_features if col in columns],
+                'text_features': [col for col in text_features or [] if col in columns] or None}
+
+    X_fit, X_holdout, y_fit, y_holdout = train_test_split(X, y, test_size=validation_size,
+                                                          random_state=random_state, stratify=y)
+    # solo refits on the same rows, so the fit times compare the feature sets alone
+    scores = {}
+    for name, columns in [('full', list(X.columns)), ('pruned', kept)]:
+        kwargs = feature_kwargs(columns)
+        train_pool, val_pool = make_pools(X_fit[columns], y_fit, kwargs['cat_features'], kwargs['text_features'],
+                                          validation_size, random_state)
+        start = time.perf_counter()
+        fitted = fit_trial(params, train_pool, val_pool, early_stopping_rounds, stopping_metric)
+        scores[f'fit_s_{name}'] = time.perf_counter() - start
+
+        holdout_pool = Pool(X_holdout[columns], y_holdout, **kwargs)
+        scores[f'accuracy_{name}'] = float(accuracy_score(y_holdout, fitted.predict(holdout_pool)))
+        scores[f'predict_ms_{name}'] = predict_time(fitted, holdout_pool) * 1000
+
+    report = {
+        'kept_features': kept,
+        'dropped_features': [col for col in X.columns if col not in keep],
+        'holdout_rows': len(X_holdout),
+        **scores,
+        'accuracy_delta': scores['accuracy_pruned'] - scores['accuracy_full']
+    }
+    report['shipped'] = 'pruned' if report['accuracy_delta'] >= -pruning['max_accuracy_drop'] else 'full'
+    logger.info(f"Pruned model: holdout accuracy {report['accuracy_delta']:+.4f}, "
+                f"fit {report['fit_s_full']:.2f}s -> {report['fit_s_pruned']:.2f}s, "
+                f"predict {report['predict_ms_full']:.2f}ms -> {report['predict_ms_pruned']:.2f}ms; "
+                f"shipping the {report['shipped']} model")
+
+    if report['shipped'] == 'full':
+        return model, None, report
+    # the shipped model learns from the same rows as the full one
+    kwargs = feature_kwargs(kept)
+    train_pool, val_pool = make_pools(X[kept], y, kwargs['cat_features'], kwargs['text_features'],
+                                      validation_size, random_state)
+    return fit_trial(params, train_pool, val_pool, early_stopping_rounds, stopping_metric), train_pool, report
+
+
+EXPORT_EXTENSIONS = {'onnx': 'onnx', 'python': 'py', 'cpp': 'cpp'}
+
+
+def export_model(model: CatBoostClassifier, pool: Pool, model_save_path: Path, idx: int,
+                 export_formats: list, logger):
+    """
+    Export a trained model to standalone formats next to its `.cbm` file.
+
+    Formats the feature set does not allow (ONNX with categorical features,
+    anything with text features) are skipped with a warning. A sidecar
+    `catboost_model_{idx}.json` records the feature order and the formats
+    written, which `src.utils.compiled_model.CompiledModel` reads.
+
+    Args:
+        model (CatBoostClassifier): Trained model.
+        pool (Pool): Training pool, needed for the categorical hash mapping.
+        model_save_path (Path): Directory of the saved models.
+        idx (int): Model index.
+        export_formats (list): Formats to try, any of 'onnx', 'python', 'cpp'.
+        logger: Logger object for logging.
+    """
+    exported = []
+    if model.get_text_feature_indices():
+        # CatBoost saves models with text features only as .cbm
+        logger.warning(f"Model {idx} uses text features, so none of {export_formats} can be exported; "
+                       f"drop train.catboost_params.text_features to export it")
+        export_formats = []
+    for export_format in export_formats:
+        export_path = model_save_path / f"catboost_model_{idx}.{EXPORT_EXTENSIONS[export_format]}"
+        try:
+            model.save_model(str(export_path), format=export_format,
+                             pool=None if export_format == 'onnx' else pool)
+            exported.append(export_format)
+            logger.info(f"Model exported to {export_path}")
+        except CatBoostError as e:
+            logger.warning(f"Model {idx} cannot be exported to {export_format}: {e}")
+
+    with open(model_save_path / f"catboost_model_{idx}.json", 'w') as meta_file:
+        json.dump({
+            'feature_names': model.feature_names_,
+            'cat_feature_indices': model.get_cat_feature_indices(),
+            'formats': exported
+        }, meta_file, indent=4)
 
 
 def train_and_save_model(
@@ -14,10 +306,25 @@ def train_and_save_model(
     model_params: dict,
     logger,
     drop_columns: list,
-    cat_features: list
+    cat_features: list,
+    use_validation: bool = False,
+    validation_size: float = 0.2,
+    early_stopping_rounds: int = None,
+    early_stopping_metric: str = None,
+    random_state: int = 42,
+    tuning: dict = None,
+    export_formats: list = None,
+    pruning: dict = None
 ):
     """
     Train and save CatBoost models for a list of training files.
+
+    With `use_validation` a share of each file is held out for early stopping.
+    With `tuning` a parallel parameter search is run per file on that split and
+    the best parameters are saved next to the model as `best_params_{idx}.json`.
+    With `export_formats` each model is also exported to standalone formats.
+    With `pruning` each model is retrained on its most important features and
+    the comparison is saved as `pruning_{idx}.json`.
     
     Args:
         train_files (list): List of paths to training files.
@@ -27,9 +334,20 @@ def train_and_save_model(
         logger: Logger object for logging.
         drop_columns (list): List of columns to drop from training data.
         cat_features (list): List of categorical feature indices.
+        use_validation (bool): Hold out a validation split for early stopping.
+        validation_size (float): Share of rows in the validation split.
+        early_stopping_rounds (int): Rounds without improvement before stopping.
+        early_stopping_metric (str): Metric watched for early stopping; `eval_metric` when None.
+        random_state (int): Seed for the validation split and the search.
+        tuning (dict): Search settings; tuning is skipped when None.
+        export_formats (list): Standalone formats to export; none when empty.
+        pruning (dict): Pruning settings; pruning is skipped when None.
     """
-    for idx, train_file in enumerate(train_files):
+    progress = ProgressLogger(logger, len(train_files), f"Training files in {model_save_path.name}")
+    for train_file in train_files:
         try:
+            # same index as the split file, so catboost_model_{idx} pairs with *_test_set_{idx}.csv
+            idx = int(Path(train_file).stem.rsplit('_', 1)[-1])
             # Load training data
             logger.info(f"Loading training data from {train_file}")
             data = pd.read_csv(train_file)
@@ -47,21 +365,65 @@ def train_and_save_model(
             X = data.drop(columns=[target_column] + (drop_columns or []), errors='ignore')
             y = data[target_column]
             
-            # Train CatBoost model
-            logger.info(f"Training CatBoost model on {train_file}")
-            model = CatBoostClassifier(**model_params)
-            model.fit(X, y, cat_features=cat_features, verbose=0)
+            if use_validation or tuning or pruning:
+                # text features are declared on the pools, not in the model params
+                params = {k: v for k, v in model_params.items() if k != 'text_features'}
+                train_pool, val_pool = make_pools(X, y, cat_features, model_params.get('text_features'),
+                                                  validation_size, random_state)
+
+                if tuning:
+                    logger.info(f"Tuning CatBoost parameters on {train_file}")
+                    model, best_params, best_score = tune_model(train_pool, val_pool, params, tuning,
+                                                                early_stopping_rounds, random_state, logger,
+                                                                early_stopping_metric)
+                    params = {**params, **best_params}
+                    params_file_path = model_save_path / f"best_params_{idx}.json"
+                    with open(params_file_path, 'w') as params_file:
+                        json.dump({
+                            'train_file': str(train_file),
+                            'params': best_params,
+                            'best_iteration': model.get_best_iteration(),
+                            params.get('eval_metric', 'Logloss'): best_score
+                        }, params_file, indent=4)
+                    logger.info(f"Best params {best_params} saved to {params_file_path}")
+                else:
+                    logger.info(f"Training CatBoost model on {train_file} with early stopping")
+                    model = fit_trial(params, train_pool, val_pool, early_stopping_rounds, early_stopping_metric)
+                logger.info(f"Best iteration: {model.get_best_iteration()}")
+
+                if pruning:
+                    model, pruned_pool, pruning_report = prune_model(
+                        model, params, X, y, cat_features, model_params.get('text_features'), pruning,
+                        validation_size, early_stopping_rounds, early_stopping_metric, random_state, logger)
+                    train_pool = pruned_pool or train_pool
+                    report_file_path = model_save_path / f"pruning_{idx}.json"
+                    with open(report_file_path, 'w') as report_file:
+                        json.dump({'train_file': str(train_file), **pruning_report}, report_file, indent=4)
+                    logger.info(f"Pruning report saved to {report_file_path}")
+            else:
+                # Train CatBoost model
+                logger.info(f"Training CatBoost model on {train_file}")
+                model = CatBoostClassifier(**model_params)
+                model.fit(X, y, cat_features=cat_features, verbose=0)
+                train_pool = None
             
             # Save the model
             model_file_name = f"catboost_model_{idx}.cbm"
             model_file_path = model_save_path / model_file_name
             model.save_model(model_file_path)
             logger.info(f"Model saved to {model_file_path}")
+
+            if export_formats:
+                if train_pool is None:
+                    train_pool = Pool(X, y, cat_features=cat_features, text_features=model_params.get('text_features'))
+                export_model(model, train_pool, model_save_path, idx, export_formats, logger)
         
         except Exception as e:
             logger.error(f"Error processing file {train_file}: {e}")
+        finally:
+            progress.update()
 
-def train_model(config_path: Text) -> None:
+def train_model(config_path: Text, tune: bool = False, prune: bool = False) -> None:
     # Load configuration file
     with open(config_path, 'r') as config_file:
         config = yaml.safe_load(config_file)
@@ -73,6 +435,16 @@ def train_model(config_path: Text) -> None:
     target_column = config['train']['target_column']
     model_params = config['train']['catboost_params']
     drop_columns = config['train']['drop_columns']
+    validation = {
+        'use_validation': config['train']['use_validation'],
+        'validation_size': config['train']['validation_size'],
+        'early_stopping_rounds': config['train']['early_stopping_rounds'],
+        'early_stopping_metric': config['train']['early_stopping_metric'],
+        'random_state': config['base']['random_state'],
+        'tuning': config['train']['tuning'] if tune or config['train']['tuning']['enabled'] else None,
+        'export_formats': config['train']['export_formats'],
+        'pruning': config['train']['pruning'] if prune or config['train']['pruning']['enabled'] else None
+    }
     
     # Attestation Data
     train_data_path_attest = Path(config['train_test_split']['train_set']['attestation_data_train'])
@@ -82,7 +454,7 @@ def train_model(config_path: Text) -> None:
     train_files_attest = list(train_data_path_attest.glob("*.csv"))
     logger.info(f"Training CatBoost models for attestation data in {train_data_path_attest}")
     cat_features_attest = config['train']['cat_features_attest']
-    train_and_save_model(train_files_attest, model_save_path_attest, target_column, model_params, logger, drop_columns,cat_features=cat_features_attest)
+    train_and_save_model(train_files_attest, model_save_path_attest, target_column, model_params, logger, drop_columns, cat_features_attest, **validation)
     
     # Movement Data
     train_data_path_movement = Path(config['train_test_split']['train_set']['movement_data_train'])
@@ -92,7 +464,7 @@ def train_model(config_path: Text) -> None:
     train_files_movement = list(train_data_path_movement.glob("*.csv"))
     logger.info(f"Training CatBoost models for movement data in {train_data_path_movement}")
     cat_features_movement = config['train']['cat_features_movement']
-    train_and_save_model(train_files_movement, model_save_path_movement, target_column, model_params, logger, drop_columns, cat_features_movement)
+    train_and_save_model(train_files_movement, model_save_path_movement, target_column, model_params, logger, drop_columns, cat_features_movement, **validation)
     
     # Static Data
     train_data_path_static = Path(config['train_test_split']['train_set']['static_data_train'])
@@ -102,11 +474,18 @@ def train_model(config_path: Text) -> None:
     train_files_static = list(train_data_path_static.glob("*.csv"))
     logger.info(f"Training CatBoost models for static data in {train_data_path_static}")
     cat_features_static = config['train']['cat_features_static']
-    train_and_save_model(train_files_static, model_save_path_static, target_column, model_params, logger, drop_columns, cat_features_static)
+    train_and_save_model(train_files_static, model_save_path_static, target_column, model_params, logger, drop_columns, cat_features_static, **validation)
 
 
 if __name__ == "__main__":
     args_parser = argparse.ArgumentParser(description="Train CatBoost models")
     args_parser.add_argument("--config_path", type=str, required=False, default="/Users/macbookpro/Desktop/my_student_retention_exp/params.yaml", help="Path of the config script")
+    args_parser.add_argument("--tune", action="store_true", help="Run a parameter search before saving each model")
+    args_parser.add_argument("--prune", action="store_true", help="Retrain each model on its most important features")
     args = args_parser.parse_args()
-    train_model(config_path=args.config_path)
+    # write logs from a background thread so training never blocks on stdout
+    listener = start_log_listener()
+    try:
+        train_model(config_path=args.config_path, tune=args.tune, prune=args.prune)
+    finally:
+        listener.stop()
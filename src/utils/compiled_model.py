@@ -0,0 +1,81 @@
+"""Provides a loader for CatBoost models exported to standalone formats."""
+
+import importlib.util
+import json
+from pathlib import Path
+from typing import Text, Union
+
+import numpy as np
+
+
+class CompiledModel:
+    """Scores NumPy batches with an exported model, without importing catboost.
+
+    The export is located from the sidecar `catboost_model_{idx}.json` written by
+    the train stage. ONNX exports run through onnxruntime, Python exports through
+    the code generated by CatBoost.
+    """
+
+    def __init__(self, model_path: Union[Text, Path], export_format: Text = None):
+        """Load an exported model.
+        Args:
+            model_path {Text or Path}: path to the model, with or without the `.cbm` suffix
+            export_format {Text}: 'onnx' or 'python'; the first exported one is used if None
+        """
+        model_path = Path(model_path).with_suffix('')
+        with open(model_path.with_suffix('.json')) as meta_file:
+            meta = json.load(meta_file)
+
+        self.feature_names = meta['feature_names']
+        self.cat_feature_indices = meta['cat_feature_indices']
+        self.float_feature_indices = [i for i in range(len(self.feature_names))
+                                      if i not in set(self.cat_feature_indices)]
+
+        available = [fmt for fmt in meta['formats'] if fmt in ('onnx', 'python')]
+        if export_format is None:
+            if not available:
+                raise ValueError(f"No ONNX or Python export found for {model_path}")
+            export_format = available[0]
+        elif export_format not in available:
+            raise ValueError(f"Model {model_path} has no {export_format} export")
+        self.export_format = export_format
+
+        if export_format == 'onnx':
+            import onnxruntime
+
+            self.session = onnxruntime.InferenceSession(str(model_path.with_suffix('.onnx')),
+                                                        providers=['CPUExecutionProvider'])
+        else:
+            spec = importlib.util.spec_from_file_location(model_path.name, model_path.with_suffix('.py'))
+            self.module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self.module)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Predict class probabilities.
+        Args:
+            X {np.ndarray}: 2D array with columns in `feature_names` order
+        Returns:
+            np.ndarray of shape (n_rows, 2), like CatBoostClassifier.predict_proba
+        """
+        X = np.atleast_2d(X)
+        if self.export_format == 'onnx':
+            probabilities = self.session.run(['probabilities'], {'features': X.astype(np.float32)})[0]
+            return np.array([[row[0], row[1]] for row in probabilities])
+
+        # the generated code scores one row at a time and returns the raw log-odds
+        raw = np.array([
+            self.module.apply_catboost_model([float(row[i]) for i in self.float_feature_indices],
+                                             [str(row[i]) for i in self.cat_feature_indices])
+            for row in X
+        ])
+        positive = 1 / (1 + np.exp(-raw))
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predict class labels.
+        Args:
+            X {np.ndarray}: 2D array with columns in `feature_names` order
+        Returns:
+            np.ndarray of 0/1 labels
+        """
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(int)
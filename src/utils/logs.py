@@ -1,9 +1,16 @@
 """Provides functions to create loggers."""
 
 import logging
+import queue
+import time
+from datetime import timedelta
+from logging.handlers import QueueHandler, QueueListener
 from typing import Text, Union
 import sys
 
+# queue used by get_logger once start_log_listener ran
+_log_queue = None
+
 
 def get_console_handler() -> logging.StreamHandler:
     """Get console handler.
@@ -18,6 +25,22 @@ def get_console_handler() -> logging.StreamHandler:
     return console_handler
 
 
+def start_log_listener() -> QueueListener:
+    """Start a listener writing queued records to stdout from a background thread.
+    Loggers created afterwards in this process only put records on the queue, so
+    hot loops never block on stdout. Call `listener.stop()` to flush at exit.
+    Returns:
+        started logging.handlers.QueueListener
+    """
+
+    global _log_queue
+    _log_queue = queue.Queue(-1)
+    listener = QueueListener(_log_queue, get_console_handler())
+    listener.start()
+
+    return listener
+
+
 def get_logger(name: Text = __name__, log_level: Union[Text, int] = logging.DEBUG) -> logging.Logger:
     """Get logger.
     Args:
@@ -34,7 +57,45 @@ def get_logger(name: Text = __name__, log_level: Union[Text, int] = logging.DEBU
     if logger.hasHandlers():
         logger.handlers.clear()
 
-    logger.addHandler(get_console_handler())
+    logger.addHandler(QueueHandler(_log_queue) if _log_queue is not None else get_console_handler())
     logger.propagate = False
 
-    return logger
\ No newline at end of file
+    return logger
+
+
+class ProgressLogger:
+    """Logs loop progress with rate and ETA, at most once per `min_interval` seconds."""
+
+    def __init__(self, logger: logging.Logger, total: int, desc: Text, min_interval: float = 5.0):
+        """
+        Args:
+            logger {logging.Logger}: logger to report to
+            total {int}: number of items in the loop
+            desc {Text}: what is being processed
+            min_interval {float}: minimum seconds between two reports
+        """
+
+        self.logger = logger
+        self.total = total
+        self.desc = desc
+        self.min_interval = min_interval
+        self.done = 0
+        self.start = self.last_report = time.monotonic()
+
+    def update(self, n: int = 1) -> None:
+        """Mark `n` more items as done and report if the interval passed or the loop finished.
+        Args:
+            n {int}: number of items finished since the last call
+        """
+
+        self.done += n
+        now = time.monotonic()
+        if now - self.last_report < self.min_interval and self.done < self.total:
+            return
+        self.last_report = now
+
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = timedelta(seconds=round((self.total - self.done) / rate)) if rate > 0 else '?'
+        self.logger.info(f"{self.desc}: {self.done}/{self.total} ({self.done / self.total:.0%}), "
+                         f"{rate:.2f} items/s, ETA {eta}")
@@ -0,0 +1,114 @@
+import uuid
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+N_STUDENTS = 60
+# nested windows that share global_start_date, like consecutive semesters of one cohort
+WINDOWS = [('2022-09-01', '2022-09-01', '2023-01-31'),
+           ('2023-02-01', '2022-09-01', '2023-06-30'),
+           ('2023-09-01', '2022-09-01', '2024-01-31')]
+GRADES = ['зачтено', 'отлично', 'хорошо', 'удовлетворительно', 'неудовлетворительно', 'Неявка', 'Не зачтено',
+          'Не выбрал']
+TEST_TYPES = ['Зачет', 'Экзамен', 'Курсовая работа', 'Дифференцированный зачет']
+BUILDINGS = ['Общежитие', 'Главный корпус', 'Научная Библиотека', 'Центр Культуры', 'Спорт.Корпус', 'Корпус 2']
+
+
+def make_attestation(rng, student_ids, n):
+    data = {f'Unnamed: {k}': np.nan for k in range(17)}
+    students = rng.integers(0, len(student_ids), n)
+    data.update({
+        'НСИ ИД': [student_ids[j] for j in students],
+        'GUIDЗачетной книги': [f'rb{j}' for j in students],
+        'GUIDУчебного плана': [f'sp{j % 7}' for j in students],
+        'Период сдачи': (pd.to_datetime('2022-09-01') + pd.to_timedelta(rng.integers(0, 520, n), unit='D'))
+        .strftime('%d.%m.%Y'),
+        'Дисциплина': rng.choice([f'Дисциплина {k}' for k in range(15)], n),
+        'Вид контроля': rng.choice(TEST_TYPES, n),
+        'Период контроля': 'Семестр',
+        'Порядковый номер периода контроля': rng.integers(1, 8, n),
+        'Учебный год': '2022/2023',
+        'Полугодие': rng.choice(['Первое', 'Второе'], n),
+        'Отметка': rng.choice(GRADES, n),
+        'Тип ведомости': 'Первичная',
+        'Есть выборы': rng.choice(['Да', 'Нет'], n),
+        'Выбрана': rng.choice(['Да', 'Нет'], n)
+    })
+    return pd.DataFrame(data)
+
+
+@pytest.fixture(scope='session')
+def raw_data(tmp_path_factory):
+    # a small synthetic copy of data/raw with the same file layouts and column names
+    root = tmp_path_factory.mktemp('raw')
+    rng = np.random.default_rng(0)
+    student_ids = [str(uuid.UUID(int=int(rng.integers(0, 2 ** 63)))) for _ in range(N_STUDENTS)]
+    guids = [str(uuid.UUID(int=int(rng.integers(0, 2 ** 63)))).upper() for _ in range(N_STUDENTS)]
+    paths = {name: root / name for name in ['attest_data', 'anonymous_data', 'movement_data', 'static_data',
+                                            'targets_data']}
+    for path in paths.values():
+        path.mkdir()
+
+    targets = []
+    for i, (start_date, global_start_date, end_date) in enumerate(WINDOWS):
+        n = 45
+        selected = rng.choice(N_STUDENTS, n, replace=False)
+        target = pd.DataFrame({
+            'student_id': [student_ids[j] for j in selected], 'start_date': start_date,
+            'global_start_date': global_start_date, 'end_date': end_date, 'is_dropout': rng.integers(0, 2, n),
+            'level': rng.choice(['Бакалавриат', 'Специалитет'], n), 'department': rng.choice(['ФТФ', 'ММФ'], n),
+            'education_form': 'Очная', 'spec_code': rng.choice(['01.03.01', '40.03.01'], n),
+            'profile': rng.choice(['Юриспруденция', None], n), 'financing': rng.choice(['бюджет', 'платно'], n),
+            'edu_year': rng.integers(1, 5, n), 'dropout_count': rng.integers(0, 2, n),
+            'events_count': rng.integers(0, 5, n), 'events': rng.choice(['перевод отпуск', 'перевод'], n),
+            'last_event': rng.choice(['перевод', 'отпуск'], n)
+        })
+        targets.append(paths['targets_data'] / f'target_{i}.csv')
+        target.to_csv(targets[-1], index=False)
+
+    # two workbooks that overlap, as consecutive exports do
+    first = make_attestation(rng, student_ids, 600)
+    first.to_excel(paths['attest_data'] / 'a1.xlsx', index=False)
+    pd.concat([first.sample(100, random_state=0), make_attestation(rng, student_ids, 300)]).to_excel(
+        paths['attest_data'] / 'a2.xlsx', index=False)
+
+    anonymous_path = paths['anonymous_data'] / 'СоответствияИД.xlsx'
+    pd.DataFrame({'ФизическоеЛицо': guids, 'НСИ_ИД': student_ids}).to_excel(anonymous_path, index=False)
+
+    # mixed-case GUIDs and a few that are missing from the mapping
+    n = 3000
+    people = rng.integers(0, N_STUDENTS + 5, n)
+    movements = pd.DataFrame({
+        'GUID': [(guids[j].lower() if j % 2 else guids[j]) if j < N_STUDENTS else str(uuid.UUID(int=j))
+                 for j in people],
+        'Дата': (pd.to_datetime('2022-09-01') + pd.to_timedelta(rng.integers(0, 500, n), unit='D'))
+        .strftime('%Y-%m-%d'),
+        'Время': [f'{h:02d}:{m:02d}:{s:02d}' for h, m, s in
+                  zip(rng.integers(7, 22, n), rng.integers(0, 60, n), rng.integers(0, 60, n))],
+        'Корпус': rng.choice(BUILDINGS, n),
+        'Направление': rng.choice(['Вход', 'Выход'], n),
+        'Допуск': 'Да'
+    })
+    movement_path = paths['movement_data'] / 'movements.csv'
+    movements.sort_values(['Дата', 'Время']).to_csv(movement_path, sep=';', encoding='windows-1251', index=False)
+
+    n = 80
+    students = rng.integers(0, N_STUDENTS, n)
+    static = pd.DataFrame({
+        'ТГУ_НСИ_Ид': [student_ids[j] for j in students], 'ДатаРождения': '01.02.2003',
+        'ГодПоступления': rng.choice(['01.09.2021', '01.09.2022'], n), 'УровеньПодготовки': 'Бакалавриат',
+        'СпециальностьНаименование': rng.choice(['Право', 'Физика'], n), 'СпециальностьКодСпециальности': '01',
+        'Профиль': 'п', 'Поступил': rng.choice(['Да', 'Нет'], n), 'ОснованиеПоступления': 'б',
+        'ФормаОбучения': 'Очная', 'Предмет1': 'Матем', 'Предмет2': rng.choice(['Физика', None], n),
+        'Предмет3': 'Рус', 'Оценка1': rng.integers(40, 100, n), 'Оценка2': rng.integers(40, 100, n),
+        'Оценка3': rng.integers(40, 100, n), 'Страна': rng.choice(['Россия', None], n),
+        'КанцелярскаяДатаПриказаОЗачислении': rng.choice(['15.08.2021', '20.08.2022'], n)
+    })
+    static_path = paths['static_data'] / 'static.xlsx'
+    # the real export has two title rows above the header
+    with pd.ExcelWriter(static_path) as writer:
+        static.to_excel(writer, index=False, startrow=2)
+
+    return {'attest': paths['attest_data'], 'anonymous': anonymous_path, 'movement': movement_path,
+            'static': static_path, 'targets': targets}
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from modules.attestation import Attestation
+from modules.duckdb_backend import DuckDBAttestation
+
+
+def test_incremental_matches_per_target(raw_data):
+    targets = raw_data['targets']
+    incremental = Attestation(raw_data['attest'], targets[0]).extract_features_incremental(targets)
+
+    assert len(incremental) == len(targets)
+    for target, features in zip(targets, incremental):
+        expected = Attestation(raw_data['attest'], target).extract_features(target)
+        assert not expected.empty
+        pd.testing.assert_frame_equal(features, expected)
+
+
+@pytest.mark.parametrize('projection, n_features', [(None, 1024), ('top_k', 10), ('hash', 16)])
+def test_incremental_discipline_matrix_matches_per_target(raw_data, projection, n_features):
+    targets = raw_data['targets']
+    attestation = Attestation(raw_data['attest'], targets[0])
+    attestation.set_discipline_space(projection, n_features)
+    incremental = attestation.extract_features_incremental(targets)
+
+    for i, target in enumerate(targets):
+        matrix = attestation.discipline_matrix(incremental[i], i)
+        assert matrix.nnz
+        for cls in [Attestation, DuckDBAttestation]:
+            per_target = cls(raw_data['attest'], target)
+            per_target.set_discipline_space(projection, n_features)
+            expected = per_target.discipline_matrix(per_target.extract_features(target))
+            assert per_target.discipline_columns == attestation.discipline_columns
+            assert matrix.shape == expected.shape
+            assert (matrix != expected).nnz == 0
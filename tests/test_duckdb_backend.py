@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from modules.attestation import Attestation
+from modules.duckdb_backend import DuckDBAttestation, DuckDBStatic, DuckDBStudentAnalysis
+from modules.movement import StudentAnalysis
+from modules.static import Static
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['all', 'sampled'])
+def student_ids(request, raw_data):
+    # sampled runs take a different load path in both backends
+    if not request.param:
+        return None
+    return pd.read_excel(raw_data['anonymous'])['НСИ_ИД'].iloc[::2].tolist()
+
+
+@pytest.mark.parametrize('target_index', [0, 1, 2])
+def test_attestation_backends_match(raw_data, student_ids, target_index):
+    target = raw_data['targets'][target_index]
+    expected = Attestation(raw_data['attest'], target, student_ids).extract_features(target)
+    features = DuckDBAttestation(raw_data['attest'], target, student_ids).extract_features(target)
+    assert not expected.empty
+    assert features.to_csv() == expected.to_csv()
+
+
+@pytest.mark.parametrize('target_index', [0, 1, 2])
+def test_movement_backends_match(raw_data, student_ids, target_index, tmp_path):
+    target = raw_data['targets'][target_index]
+    expected = StudentAnalysis(raw_data['movement'], raw_data['anonymous'], target, student_ids,
+                               chunksize=500).extract_features(target)
+    features = DuckDBStudentAnalysis(raw_data['movement'], raw_data['anonymous'], target, student_ids,
+                                     chunksize=500, guid_table_dir=tmp_path).extract_features(target)
+    assert not expected.empty
+    assert features.to_csv() == expected.to_csv()
+
+
+@pytest.mark.parametrize('target_index', [0, 1, 2])
+def test_static_backends_match(raw_data, student_ids, target_index):
+    target = raw_data['targets'][target_index]
+    expected = Static(raw_data['static'], target, student_ids).get_features(target)
+    features = DuckDBStatic(raw_data['static'], target, student_ids).get_features(target)
+    assert not expected.empty
+    assert features.to_csv() == expected.to_csv()
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.movement import StudentAnalysis
+from modules.movement_stream import MovementStream
+
+HEADER = 'GUID;Дата;Время;Корпус;Направление;Допуск\n'
+
+
+@pytest.fixture(scope='module')
+def expected_features(raw_data, tmp_path_factory):
+    # StudentAnalysis over one window covering every event is what the stream keeps
+    target_path = tmp_path_factory.mktemp('stream') / 'target.csv'
+    target = pd.read_csv(raw_data['targets'][0])
+    target = target.assign(start_date='2022-01-01', global_start_date='2022-01-01', end_date='2025-01-01')
+    target.to_csv(target_path, index=False)
+    features = StudentAnalysis(raw_data['movement'], raw_data['anonymous'], target_path).extract_features(target_path)
+    return features.set_index('student_id')
+
+
+def append(path, data):
+    with open(path, 'ab') as event_file:
+        event_file.write(data)
+
+
+def test_stream_matches_student_analysis(raw_data, expected_features, tmp_path):
+    event_path, checkpoint_path = tmp_path / 'events.csv', tmp_path / 'state.npz'
+    data = raw_data['movement'].read_bytes()
+    # ragged chunks that split lines, the header included
+    cuts = np.r_[0, 7, np.sort(np.random.default_rng(0).choice(np.arange(8, len(data)), 40, replace=False)), len(data)]
+
+    stream = MovementStream(event_path, raw_data['anonymous'], checkpoint_path)
+    for i, (start, end) in enumerate(zip(cuts[:-1], cuts[1:])):
+        append(event_path, data[start:end])
+        stream.poll()
+        if i == len(cuts) // 2:
+            # restart from a checkpoint halfway through
+            stream.save_checkpoint()
+            stream = MovementStream(event_path, raw_data['anonymous'], checkpoint_path)
+
+    assert stream.offset == len(data)
+    assert stream.n_events == len(pd.read_csv(raw_data['movement'], sep=';', encoding='windows-1251'))
+    features = stream.features(expected_features.index)
+    pd.testing.assert_frame_equal(features, expected_features[features.columns], check_dtype=False,
+                                  check_names=False)
+
+
+def test_malformed_events_are_skipped(raw_data, tmp_path):
+    event_path, checkpoint_path = tmp_path / 'events.csv', tmp_path / 'state.npz'
+    guid = pd.read_excel(raw_data['anonymous'])['ФизическоеЛицо'].iloc[0]
+    append(event_path, (HEADER + f'{guid};2023-03-01;09:00:00;Общежитие;Вход;Да\n'
+                        f'{guid};2023-03-01;not a time;Общежитие;Выход;Да\n').encode('windows-1251'))
+
+    stream = MovementStream(event_path, raw_data['anonymous'], checkpoint_path)
+    assert stream.poll() == 1
+    assert (stream.n_events, stream.malformed_events, stream.unmatched_events) == (2, 1, 0)
+    assert stream.offset == event_path.stat().st_size
+    assert stream.visits.sum() == 1
+
+    stream.save_checkpoint()
+    restarted = MovementStream(event_path, raw_data['anonymous'], checkpoint_path)
+    assert (restarted.offset, restarted.n_events, restarted.malformed_events) == (stream.offset, 2, 1)
+    assert restarted.poll() == 0
+
+
+def test_failed_batch_is_read_again(raw_data, tmp_path):
+    event_path = tmp_path / 'events.csv'
+    guid = pd.read_excel(raw_data['anonymous'])['ФизическоеЛицо'].iloc[0]
+    append(event_path, (HEADER + f'{guid};2023-03-01;09:00:00;Общежитие;Вход;Да\n').encode('windows-1251'))
+    stream = MovementStream(event_path, raw_data['anonymous'])
+    stream.poll()
+    offset = stream.offset
+
+    # a line with extra fields fails the whole batch before any state changes
+    append(event_path, (f'{guid};2023-03-01;10:00:00;Общежитие;Выход;Да\n'
+                        f'{guid};2023-03-01;11:00:00;Общежитие;Вход;Да;x;y\n').encode('windows-1251'))
+    with pytest.raises(pd.errors.ParserError):
+        stream.poll()
+    assert (stream.offset, stream.n_events, stream.visits.sum()) == (offset, 1, 1)